@@ -0,0 +1,225 @@
+import asyncio
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import aiohttp
+
+from cache import TTLCache
+from metrics import span, inc
+from rate_limiter import QUOTA, INTERACTIVE
+from resilience import CircuitBreaker, CLOSED
+from singleflight import SingleFlight
+from storage import shared_cache_get, shared_cache_set, save_in_background
+from config import FOOTBALL_API_URL, FOOTBALL_API_HEADERS, API_TIMEOUT, API_MAX_CONNECTIONS, API_MAX_CONCURRENCY, \
+    API_KEEPALIVE_TIMEOUT, API_CACHE_TTLS, API_CACHE_LIVE_TTL, API_CACHE_MAX_STALE, API_CACHE_MAX_ENTRIES, \
+    API_CACHE_MAX_BYTES, SHARED_CACHE
+
+_session = None
+_semaphore = None
+
+RESPONSE_CACHE = TTLCache(max_entries=API_CACHE_MAX_ENTRIES, max_bytes=API_CACHE_MAX_BYTES)
+IN_FLIGHT = SingleFlight()
+BREAKER = CircuitBreaker('Football API')
+
+_refresh_tasks = set()
+
+# Upstream requests made on behalf of the current task, see count_requests()
+_request_counter = ContextVar('api_request_counter', default=None)
+
+
+def get_session():
+    global _session, _semaphore
+
+    # One keep-alive pool shared by every getter, created lazily inside the running loop
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=API_MAX_CONNECTIONS, keepalive_timeout=API_KEEPALIVE_TIMEOUT)
+        headers = {key: value for key, value in FOOTBALL_API_HEADERS.items() if value is not None}
+        _session = aiohttp.ClientSession(headers=headers, connector=connector,
+                                         timeout=aiohttp.ClientTimeout(total=API_TIMEOUT))
+        _semaphore = asyncio.Semaphore(API_MAX_CONCURRENCY)
+    return _session
+
+
+def get_cache_key(endpoint, params=None):
+    return endpoint, tuple(sorted((params or {}).items()))
+
+
+def get_cache_ttl(endpoint, params=None):
+    if endpoint == 'fixtures' and params and 'live' in params:
+        return API_CACHE_LIVE_TTL
+    return API_CACHE_TTLS.get(endpoint)
+
+
+def get_max_stale(endpoint, params=None):
+    # Live scores are worthless once they're behind
+    if endpoint == 'fixtures' and params and 'live' in params:
+        return 0
+    return API_CACHE_MAX_STALE.get(endpoint, 0)
+
+
+async def api_get(endpoint, params=None, timeout=None, use_cache=True, priority=INTERACTIVE, refresh=False,
+                  on_fetch=None):
+    """GET an endpoint through the response cache; `on_fetch(data)` only sees data that came from the upstream."""
+    ttl = get_cache_ttl(endpoint, params) if use_cache else None
+    key = get_cache_key(endpoint, params)
+
+    # A refresh always asks the upstream, but still stores what it gets
+    if ttl and not refresh:
+        # Stale data is for users who'd otherwise wait, background jobs are there to fetch fresh data
+        max_stale = get_max_stale(endpoint, params) if priority == INTERACTIVE else 0
+        data = RESPONSE_CACHE.get(key, allow_stale=max_stale > 0, max_stale=max_stale)
+        if SHARED_CACHE and (data is None or key not in RESPONSE_CACHE):
+            # Another worker may already have fetched it
+            shared = shared_cache_get('api', repr(key))
+            if shared is not None:
+                RESPONSE_CACHE.set(key, shared, ttl=ttl, size=len(json.dumps(shared)))
+                inc('football_api_cache_total', endpoint=endpoint, result='shared')
+                return 200, shared
+        if data is not None:
+            if key in RESPONSE_CACHE:
+                inc('football_api_cache_total', endpoint=endpoint, result='hit')
+                return 200, data
+
+            # Stale-while-revalidate: answer with the last good result now and refresh it in the background,
+            # unless the upstream is failing or the quota is better kept for requests with nothing cached
+            if BREAKER.ready() and not QUOTA.is_low(priority):
+                schedule_refresh(endpoint, params, timeout, key, ttl, priority, on_fetch)
+            inc('football_api_cache_total', endpoint=endpoint, result='stale')
+            return 200, data
+        inc('football_api_cache_total', endpoint=endpoint, result='miss')
+
+    # Identical concurrent requests share one upstream call and one parsed result
+    return await IN_FLIGHT.do(key, _fetch, endpoint, params, timeout, key, ttl, priority, on_fetch)
+
+
+def get_cached(endpoint, params=None):
+    """The cached response while it is fresh, None otherwise; never asks the upstream."""
+    key = get_cache_key(endpoint, params)
+    if not get_cache_ttl(endpoint, params) or key not in RESPONSE_CACHE:
+        return None
+    inc('football_api_cache_total', endpoint=endpoint, result='hit')
+    return RESPONSE_CACHE.get(key)
+
+
+def schedule_refresh(endpoint, params, timeout, key, ttl, priority, on_fetch=None):
+    if key in IN_FLIGHT:
+        return
+
+    async def refresh():
+        try:
+            await IN_FLIGHT.do(key, _fetch, endpoint, params, timeout, key, ttl, priority, on_fetch)
+        except Exception as e:
+            logging.warning("Background refresh of %s failed: %s", endpoint, e)
+
+    task = asyncio.create_task(refresh())
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+
+
+@contextmanager
+def count_requests():
+    """Counts the upstream requests sent inside the block; calls sharing another caller's request cost nothing."""
+    counter = [0]
+    token = _request_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _request_counter.reset(token)
+
+
+def record_failure():
+    # Bot workers share their trips, one worker seeing the upstream fail spares the others the same failures
+    if BREAKER.record_failure() and SHARED_CACHE:
+        save_in_background(shared_cache_set, 'breaker', BREAKER.name, time.time(), BREAKER.reset_timeout)
+
+
+def sync_breaker():
+    if SHARED_CACHE and BREAKER.state == CLOSED:
+        opened_at = shared_cache_get('breaker', BREAKER.name)
+        if opened_at is not None:
+            BREAKER.trip(time.time() - opened_at)
+
+
+async def _fetch(endpoint, params, timeout, key, ttl, priority, on_fetch=None):
+    session = get_session()
+    request_timeout = aiohttp.ClientTimeout(total=timeout) if timeout is not None else None
+
+    with span('api_quota', endpoint=endpoint):
+        await QUOTA.acquire(priority)
+
+    # Checked right before sending, a half-open probe claimed here must end in a success or a failure
+    sync_breaker()
+    probing = BREAKER.check()
+    counter = _request_counter.get()
+    if counter is not None:
+        counter[0] += 1
+    try:
+        # Bound the number of requests in flight so a spike doesn't open hundreds of sockets
+        try:
+            async with _semaphore:
+                with span('api_request', endpoint=endpoint):
+                    async with session.get(f'{FOOTBALL_API_URL}/{endpoint}', params=params,
+                                           timeout=request_timeout) as response:
+                        body = await response.read()
+                        status = response.status
+                        QUOTA.update(response.headers, status)
+            inc('football_api_requests_total', endpoint=endpoint, status=status)
+            with span('api_json', endpoint=endpoint):
+                data = json.loads(body)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            inc('football_api_errors_total', endpoint=endpoint, error=type(e).__name__)
+            record_failure()
+            raise
+
+        # Server errors and throttling count against the upstream, client errors don't
+        if status >= 500 or status == 429:
+            record_failure()
+        else:
+            BREAKER.record_success()
+    finally:
+        if probing:
+            BREAKER.release_probe()
+
+    # Only successful responses are worth keeping, the raw body size is used as the memory estimate
+    if ttl and status == 200:
+        RESPONSE_CACHE.set(key, data, ttl=ttl, size=len(body))
+        if SHARED_CACHE:
+            save_in_background(shared_cache_set, 'api', repr(key), data, ttl)
+    if on_fetch is not None and status == 200:
+        on_fetch(data)
+
+    return status, data
+
+
+def cache_response(endpoint, params, data):
+    # Lets a batched request fill the entries its single-item equivalents would have used
+    ttl = get_cache_ttl(endpoint, params)
+    if ttl:
+        RESPONSE_CACHE.set(get_cache_key(endpoint, params), data, ttl=ttl, size=len(json.dumps(data)))
+        if SHARED_CACHE:
+            save_in_background(shared_cache_set, 'api', repr(get_cache_key(endpoint, params)), data, ttl)
+
+
+def get_cache_stats():
+    stats = RESPONSE_CACHE.stats()
+    stats["coalesced"] = IN_FLIGHT.shared
+    return stats
+
+
+def get_quota_stats():
+    return QUOTA.stats()
+
+
+def get_breaker_stats():
+    return BREAKER.stats()
+
+
+async def close_session():
+    global _session
+
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
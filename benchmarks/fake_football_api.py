@@ -0,0 +1,68 @@
+"""Local stand-in for the RapidAPI football API with configurable latency.
+
+Run on its own with: python -m benchmarks.fake_football_api [--port 8081] [--latency 0.2] [--recorded DIR]
+and point the bot at it with FOOTBALL_API_URL=http://127.0.0.1:8081
+"""
+import argparse
+import asyncio
+import random
+from collections import Counter
+
+from aiohttp import web
+
+from benchmarks.payloads import GENERATORS, get_payload, load_recorded
+
+
+class FakeFootballAPI:
+    """Answers every endpoint the bot uses after `latency` ± `jitter` seconds and counts the calls."""
+
+    def __init__(self, latency=0.1, jitter=0.05, daily_limit=100000, recorded=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.daily_limit = daily_limit
+        self.recorded = recorded or {}
+        self.calls = Counter()
+
+    async def handle(self, request: web.Request):
+        endpoint = request.match_info['endpoint']
+        if endpoint not in GENERATORS:
+            return web.json_response({"errors": {"endpoint": "unknown"}}, status=404)
+
+        self.calls[endpoint] += 1
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        headers = {
+            'x-ratelimit-requests-limit': str(self.daily_limit),
+            'x-ratelimit-requests-remaining': str(max(self.daily_limit - sum(self.calls.values()), 0))
+        }
+        return web.json_response(get_payload(endpoint, dict(request.query), self.recorded), headers=headers)
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_get('/{endpoint:.+}', self.handle)
+        return app
+
+
+async def start_server(app, host='127.0.0.1', port=0):
+    """Starts `app` in the running loop, returns the runner and the base URL it listens on."""
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f'http://{host}:{port}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve fake football API responses")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--recorded', help="directory with recorded <endpoint>.json responses")
+    args = parser.parse_args()
+
+    api = FakeFootballAPI(args.latency, args.jitter, recorded=load_recorded(args.recorded) if args.recorded else None)
+    web.run_app(api.make_app(), host=args.host, port=args.port)
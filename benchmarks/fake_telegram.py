@@ -0,0 +1,84 @@
+"""Local stand-in for the Telegram Bot API, enough for the methods the bot calls.
+
+Point the bot at it with TELEGRAM_API_URL=http://127.0.0.1:<port>
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+
+from aiohttp import web
+
+
+class FakeTelegram:
+    """Answers sendMessage, sendPhoto and sendMediaGroup after `latency` seconds and counts the calls."""
+
+    def __init__(self, latency=0.03):
+        self.latency = latency
+        self.calls = Counter()
+        self.uploads = 0
+        self.uploaded_bytes = 0
+        self.message_ids = itertools.count(1)
+        self.file_ids = itertools.count(1)
+
+    def make_message(self, chat_id, **fields):
+        return {
+            "message_id": next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            **fields
+        }
+
+    async def read_form(self, request: web.Request):
+        form = {}
+        if request.content_type == 'multipart/form-data':
+            reader = await request.multipart()
+            async for part in reader:
+                if part.filename:
+                    # An uploaded file, only its size matters here
+                    size = len(await part.read())
+                    self.uploads += 1
+                    self.uploaded_bytes += size
+                    form[part.name] = size
+                else:
+                    form[part.name] = await part.text()
+        elif request.can_read_body:
+            form = dict(await request.post())
+        return form
+
+    async def handle(self, request: web.Request):
+        method = request.match_info['method']
+        form = await self.read_form(request)
+        self.calls[method] += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+
+        if method == 'getMe':
+            result = {"id": 123456, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"}
+        elif method == 'sendMessage':
+            result = self.make_message(int(form.get('chat_id', 0)), text=form.get('text', ''))
+        elif method == 'sendPhoto':
+            # Uploads get a new file id, resends by file id keep theirs
+            photo = form.get('photo')
+            file_id = f'photo-{next(self.file_ids)}' if isinstance(photo, int) else photo
+            result = self.make_message(int(form.get('chat_id', 0)), photo=[
+                {"file_id": file_id, "file_unique_id": file_id, "width": 1000, "height": 600}
+            ])
+        elif method == 'sendMediaGroup':
+            # Photos are either attach://<field> uploads or file ids already known
+            result = []
+            for media in json.loads(form.get('media', '[]')):
+                uploaded = media['media'].startswith('attach://')
+                file_id = f'photo-{next(self.file_ids)}' if uploaded else media['media']
+                result.append(self.make_message(int(form.get('chat_id', 0)), caption=media.get('caption'), photo=[
+                    {"file_id": file_id, "file_unique_id": file_id, "width": 1000, "height": 600}
+                ]))
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    def make_app(self):
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        return app
@@ -0,0 +1,161 @@
+"""Drives the main.py dispatcher with simulated chats against local fake football and Telegram APIs.
+
+Nothing leaves the machine, so no API quota is spent. Run from the repository root:
+
+    python -m benchmarks.load_test --chats 2000 --concurrency 200 --api-latency 0.2
+
+Every chat walks through the whole menu: league, table, a team, its players and last matches, the
+matches on-air and a match comparison. Latency is reported per handler, together with the throughput
+and the peak RSS of the bot process and of its render workers.
+
+The bot's own settings still apply, e.g. API_RATE_LIMIT_PER_MINUTE paces the calls to the fake API
+just like the real one, and RENDER_ENGINE=pillow switches the table renderer.
+"""
+import argparse
+import asyncio
+import os
+import resource
+import tempfile
+import time
+from collections import defaultdict
+
+from benchmarks import payloads
+from benchmarks.fake_football_api import FakeFootballAPI, start_server
+from benchmarks.fake_telegram import FakeTelegram
+
+
+def get_peak_rss(pid):
+    # VmHWM is the peak resident set size of a running process, in kilobytes
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+def get_script(chat_id):
+    league_id = payloads.league_ids()[chat_id % payloads.LEAGUE_COUNT]
+    team_id = payloads.team_ids(league_id)[chat_id % payloads.TEAMS_PER_LEAGUE]
+    fixture_id = payloads.live_fixture_ids(league_id)[chat_id % payloads.LIVE_MATCHES_PER_LEAGUE]
+    return ['/start', payloads.league_name(league_id), 'Table', 'Team', payloads.team_name(team_id), 'Players',
+            'Last 10 matches', 'Matches on-air', 'Match comparison', str(fixture_id)]
+
+
+def configure(football_api_url, telegram_api_url, store_dir):
+    # Read by config.py on import, so this has to happen before the bot modules are loaded
+    os.environ['FOOTBALL_API_URL'] = football_api_url
+    os.environ['TELEGRAM_API_URL'] = telegram_api_url
+    os.environ['STORE_PATH'] = os.path.join(store_dir, 'football.sqlite3')
+    os.environ['TELE_TOKEN'] = '123456:benchmark'
+    os.environ['RAPIDAPI_TOKEN'] = 'benchmark'
+    os.environ['FAST_START'] = '0'
+    os.environ['LIVE_POLLER_ENABLED'] = '0'
+
+
+async def run(args):
+    football_api = FakeFootballAPI(args.api_latency, args.api_jitter,
+                                   recorded=payloads.load_recorded(args.recorded) if args.recorded else None)
+    telegram = FakeTelegram(args.telegram_latency)
+    football_runner, football_api_url = await start_server(football_api.make_app())
+    telegram_runner, telegram_api_url = await start_server(telegram.make_app())
+
+    with tempfile.TemporaryDirectory() as store_dir:
+        configure(football_api_url, telegram_api_url, store_dir)
+
+        from aiogram import Bot, Dispatcher, types
+        from aiogram.dispatcher.handler import current_handler
+        from aiogram.dispatcher.middlewares import BaseMiddleware
+        from webhook import make_message_update
+        import main
+        import render_pool
+
+        handler_latencies = defaultdict(list)
+
+        class HandlerTimer(BaseMiddleware):
+            async def on_process_message(self, message: types.Message, data: dict):
+                data['benchmark_handler'] = current_handler.get().__name__
+                data['benchmark_started'] = time.perf_counter()
+
+            async def on_post_process_message(self, message: types.Message, results, data: dict):
+                if 'benchmark_started' in data:
+                    handler_latencies[data['benchmark_handler']].append(time.perf_counter() - data['benchmark_started'])
+
+        main.dp.middleware.setup(HandlerTimer())
+
+        started = time.perf_counter()
+        await main.on_startup(main.dp)
+        startup_time = time.perf_counter() - started
+
+        update_ids = iter(range(1, 10 ** 9))
+        semaphore = asyncio.Semaphore(args.concurrency)
+        update_latencies = []
+        failures = 0
+
+        async def simulate_chat(chat_id):
+            nonlocal failures
+            async with semaphore:
+                Bot.set_current(main.bot)
+                Dispatcher.set_current(main.dp)
+                for text in get_script(chat_id):
+                    update = types.Update.to_object(make_message_update(next(update_ids), chat_id, text))
+                    update_started = time.perf_counter()
+                    try:
+                        await main.dp.process_update(update)
+                    except Exception as e:
+                        failures += 1
+                        print(f"chat {chat_id} {text!r}: {e!r}")
+                    update_latencies.append(time.perf_counter() - update_started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(simulate_chat(chat_id) for chat_id in range(1, args.chats + 1)))
+        elapsed = time.perf_counter() - started
+
+        # Render workers are started by the forkserver, not by this process, so they are measured while running
+        executor = render_pool._executor
+        render_rss = max((get_peak_rss(pid) for pid in (executor._processes if executor else ())), default=0)
+
+        await main.on_shutdown(main.dp)
+        await (await main.bot.get_session()).close()
+
+    await football_runner.cleanup()
+    await telegram_runner.cleanup()
+
+    print(f"startup: {startup_time:.2f}s")
+    print(f"{args.chats} chats, {len(update_latencies)} updates in {elapsed:.2f}s "
+          f"({len(update_latencies) / elapsed:.1f} updates/s), {failures} failed")
+    print(f"update latency: p50 {percentile(update_latencies, 0.5) * 1000:.1f} ms, "
+          f"p99 {percentile(update_latencies, 0.99) * 1000:.1f} ms")
+    print()
+    print(f"{'handler':<32}{'calls':>8}{'p50 ms':>10}{'p99 ms':>10}{'calls/s':>10}")
+    for name, latencies in sorted(handler_latencies.items()):
+        print(f"{name:<32}{len(latencies):>8}{percentile(latencies, 0.5) * 1000:>10.1f}"
+              f"{percentile(latencies, 0.99) * 1000:>10.1f}{len(latencies) / elapsed:>10.1f}")
+    print()
+    print("football API calls:", dict(football_api.calls))
+    print("telegram calls:", dict(telegram.calls), f"({telegram.uploads} uploads, {telegram.uploaded_bytes} bytes)")
+    # ru_maxrss is in kilobytes on Linux
+    print(f"peak RSS: bot {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB, "
+          f"render workers {render_rss / 1024:.0f} MB each at most")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the bot against local fake APIs")
+    parser.add_argument('--chats', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=100, help="chats talking to the bot at the same time")
+    parser.add_argument('--api-latency', type=float, default=0.1)
+    parser.add_argument('--api-jitter', type=float, default=0.05)
+    parser.add_argument('--telegram-latency', type=float, default=0.03)
+    parser.add_argument('--recorded', help="directory with recorded <endpoint>.json football API responses")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
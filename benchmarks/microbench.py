@@ -0,0 +1,80 @@
+"""Per-call cost of each renderer, under both engines, and of each football API response parser.
+
+Run from the repository root: python -m benchmarks.microbench [iterations]
+"""
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+
+import image_makers  # noqa: E402
+import pil_renderers  # noqa: E402
+from benchmarks import payloads  # noqa: E402
+from football_api_getters import parse_leagues, parse_teams, parse_standings, parse_team_form, parse_players, \
+    parse_live_matches, parse_prediction  # noqa: E402
+
+LEAGUE_ID = 1
+TEAM_ID = payloads.team_ids(LEAGUE_ID)[0]
+FIXTURE_ID = payloads.live_fixture_ids(LEAGUE_ID)[0]
+
+
+def measure(func, iterations, *args):
+    # The first call pays for imports, fonts and templates, so it isn't counted
+    func(*args)
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func(*args)
+    return (time.perf_counter() - started) / iterations
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    responses = {
+        'leagues': payloads.leagues({}),
+        'teams': payloads.teams({'league': LEAGUE_ID}),
+        'standings': payloads.standings({'league': LEAGUE_ID}),
+        'team_form': payloads.fixtures({'team': TEAM_ID, 'last': 10}),
+        'players': payloads.squads({'team': TEAM_ID}),
+        'live_matches': payloads.fixtures({'live': str(LEAGUE_ID)}),
+        'prediction': payloads.predictions({'fixture': FIXTURE_ID})
+    }
+    parsers = [
+        ('parse_leagues', parse_leagues, (responses['leagues'],)),
+        ('parse_teams', parse_teams, (responses['teams'],)),
+        ('parse_standings', parse_standings, (responses['standings'],)),
+        ('parse_team_form', parse_team_form, (responses['team_form'], payloads.team_name(TEAM_ID))),
+        ('parse_players', parse_players, (responses['players'],)),
+        ('parse_live_matches', parse_live_matches, (responses['live_matches'],)),
+        ('parse_prediction', parse_prediction, (responses['prediction'],))
+    ]
+
+    print(f"{'parser':<40}{'us/call':>10}")
+    for name, parser, args in parsers:
+        print(f"{name:<40}{measure(parser, iterations * 100, *args) * 1e6:>10.1f}")
+
+    standings = parse_standings(responses['standings'])
+    players = parse_players(responses['players'])
+    results = parse_team_form(responses['team_form'], payloads.team_name(TEAM_ID))
+    prediction = parse_prediction(responses['prediction'])
+    renderers = [
+        ('make_standings_table_image', standings),
+        ('create_players_table', players),
+        ('create_result_table', results)
+    ]
+
+    print()
+    print(f"{'renderer':<40}{'matplotlib ms':>15}{'pillow ms':>12}")
+    for name, rows in renderers:
+        matplotlib_time = measure(getattr(image_makers, name), iterations, rows)
+        pillow_time = measure(getattr(pil_renderers, name), iterations, rows)
+        print(f"{name:<40}{matplotlib_time * 1000:>15.1f}{pillow_time * 1000:>12.1f}")
+
+    wind_rose_time = measure(image_makers.create_wind_rose_by_predictions, iterations, prediction)
+    print(f"{'create_wind_rose_by_predictions':<40}{wind_rose_time * 1000:>15.1f}{'-':>12}")
+
+
+if __name__ == '__main__':
+    main()
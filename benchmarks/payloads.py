@@ -0,0 +1,204 @@
+"""Synthetic API-Football payloads, or recorded ones replayed from a directory.
+
+Every payload is derived from the request parameters, so the same request always gets the same answer
+and the bot's caches behave as they would against the real API.
+"""
+import json
+import os
+import random
+import time
+
+LEAGUE_COUNT = 40
+TEAMS_PER_LEAGUE = 20
+PLAYERS_PER_TEAM = 25
+LIVE_MATCHES_PER_LEAGUE = 3
+# Keeps live fixture ids apart from the ids of past fixtures
+LIVE_FIXTURE_BASE = 10000000
+
+POSITIONS = ('Goalkeeper', 'Defender', 'Midfielder', 'Attacker')
+COMPARISON_FIELDS = ('form', 'att', 'def', 'poisson_distribution', 'h2h', 'goals', 'total')
+
+
+def league_ids():
+    return list(range(1, LEAGUE_COUNT + 1))
+
+
+def league_name(league_id):
+    return f"League {league_id}"
+
+
+def team_ids(league_id):
+    return [league_id * 100 + number for number in range(TEAMS_PER_LEAGUE)]
+
+
+def team_name(team_id):
+    return f"Team {team_id}"
+
+
+def live_fixture_ids(league_id):
+    return [LIVE_FIXTURE_BASE + league_id * 100 + number for number in range(LIVE_MATCHES_PER_LEAGUE)]
+
+
+def upcoming_fixture_ids(league_id, count):
+    return [LIVE_FIXTURE_BASE + league_id * 100 + 50 + number for number in range(min(count, TEAMS_PER_LEAGUE // 2))]
+
+
+def _team(team_id):
+    return {"id": team_id, "name": team_name(team_id)}
+
+
+def _fixture(fixture_id, league_id, home_id, away_id, rng, status='FT'):
+    return {
+        "fixture": {
+            "id": fixture_id,
+            "timestamp": 1700000000 + fixture_id,
+            "status": {"short": status, "elapsed": 90 if status == 'FT' else rng.randint(1, 89)}
+        },
+        "league": {"id": league_id},
+        "teams": {"home": _team(home_id), "away": _team(away_id)},
+        "goals": {"home": rng.randint(0, 4), "away": rng.randint(0, 4)}
+    }
+
+
+def _response(items):
+    return {"results": len(items), "response": items}
+
+
+def leagues(params):
+    return _response([{
+        "league": {"id": league_id, "name": league_name(league_id)},
+        "country": {"name": f"Country {league_id}"},
+        "seasons": [{"year": year} for year in range(2018, 2026)]
+    } for league_id in league_ids()])
+
+
+def teams(params):
+    return _response([{"team": _team(team_id)} for team_id in team_ids(int(params['league']))])
+
+
+def standings(params):
+    league_id = int(params['league'])
+    rng = random.Random(league_id)
+    rows = []
+    for rank, team_id in enumerate(team_ids(league_id), start=1):
+        won, draw = rng.randint(0, 20), rng.randint(0, 10)
+        lost = 38 - won - draw
+        rows.append({
+            "rank": rank,
+            "team": _team(team_id),
+            "points": won * 3 + draw,
+            "all": {"played": 38, "win": won, "draw": draw, "lose": lost}
+        })
+    return _response([{"league": {"id": league_id, "standings": [rows]}}])
+
+
+def fixtures(params):
+    if 'live' in params:
+        # "live" is a dash separated list of league ids
+        items = []
+        for league_id in sorted({int(league_id) for league_id in params['live'].split('-')}):
+            rng = random.Random(league_id)
+            ids = team_ids(league_id)
+            for number, fixture_id in enumerate(live_fixture_ids(league_id)):
+                items.append(_fixture(fixture_id, league_id, ids[2 * number], ids[2 * number + 1], rng, status='2H'))
+        return _response(items)
+
+    if 'ids' in params:
+        # Live and upcoming fixtures by id, anything else is a finished past fixture
+        items = []
+        for fixture_id in sorted({int(fixture_id) for fixture_id in params['ids'].split('-')}):
+            if fixture_id >= LIVE_FIXTURE_BASE:
+                league_id, number = divmod(fixture_id - LIVE_FIXTURE_BASE, 100)
+                status = 'NS' if number >= 50 else '2H'
+            else:
+                league_id, number = fixture_id // 10000, fixture_id % 100
+                status = 'FT'
+            rng = random.Random(fixture_id)
+            ids = team_ids(league_id) if league_id in league_ids() else [1, 2]
+            fixture = _fixture(fixture_id, league_id, ids[0], ids[1], rng, status=status)
+            if status == 'NS':
+                fixture['fixture']['timestamp'] = int(time.time()) + 3 * 24 * 60 * 60
+                fixture['goals'] = {"home": None, "away": None}
+            items.append(fixture)
+        return _response(items)
+
+    if 'next' in params:
+        league_id = int(params['league'])
+        rng = random.Random(league_id)
+        ids = team_ids(league_id)
+        items = []
+        for number, fixture_id in enumerate(upcoming_fixture_ids(league_id, int(params['next']))):
+            fixture = _fixture(fixture_id, league_id, ids[2 * number], ids[2 * number + 1], rng, status='NS')
+            # Kicks off in a few days, no score yet
+            fixture['fixture']['timestamp'] = int(time.time()) + 3 * 24 * 60 * 60
+            fixture['goals'] = {"home": None, "away": None}
+            items.append(fixture)
+        return _response(items)
+
+    team_id = int(params['team'])
+    league_id = team_id // 100
+    rng = random.Random(team_id)
+    opponents = [opponent for opponent in team_ids(league_id) if opponent != team_id]
+    items = []
+    for number in range(int(params.get('last', 10))):
+        opponent = opponents[number % len(opponents)]
+        home_id, away_id = (team_id, opponent) if number % 2 == 0 else (opponent, team_id)
+        items.append(_fixture(team_id * 100 + number, league_id, home_id, away_id, rng))
+    return _response(items)
+
+
+def squads(params):
+    team_id = int(params['team'])
+    rng = random.Random(team_id)
+    return _response([{
+        "team": _team(team_id),
+        "players": [{
+            "id": team_id * 100 + number,
+            "name": f"Player {team_id}-{number}",
+            "age": rng.randint(17, 36),
+            "number": number + 1,
+            "position": POSITIONS[number % len(POSITIONS)]
+        } for number in range(PLAYERS_PER_TEAM)]
+    }])
+
+
+def predictions(params):
+    fixture_id = int(params['fixture'])
+    league_id = (fixture_id - LIVE_FIXTURE_BASE) // 100
+    rng = random.Random(fixture_id)
+    comparison = {}
+    for field in COMPARISON_FIELDS:
+        home = rng.randint(0, 100)
+        comparison[field] = {"home": f"{home}%", "away": f"{100 - home}%"}
+    ids = team_ids(league_id) if league_id in league_ids() else [1, 2]
+    return _response([{
+        "teams": {"home": _team(ids[0]), "away": _team(ids[1])},
+        "comparison": comparison
+    }])
+
+
+GENERATORS = {
+    'leagues': leagues,
+    'teams': teams,
+    'standings': standings,
+    'fixtures': fixtures,
+    'players/squads': squads,
+    'predictions': predictions
+}
+
+
+def load_recorded(directory):
+    """Recorded responses named after their endpoint, e.g. standings.json or players_squads.json."""
+    recorded = {}
+    for endpoint in GENERATORS:
+        path = os.path.join(directory, endpoint.replace('/', '_') + '.json')
+        if os.path.exists(path):
+            with open(path) as file:
+                recorded[endpoint] = json.load(file)
+    return recorded
+
+
+def get_payload(endpoint, params, recorded=None):
+    if recorded and endpoint in recorded:
+        return recorded[endpoint]
+    return GENERATORS[endpoint](params)
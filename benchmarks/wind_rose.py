@@ -0,0 +1,43 @@
+"""Per-request cost of the prediction wind rose, freshly built figure vs cached template.
+
+Run from the repository root: python -m benchmarks.wind_rose [iterations]
+"""
+import random
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+
+from image_makers import create_wind_rose_by_predictions  # noqa: E402
+from records import Prediction  # noqa: E402
+
+FIELDS = ('form', 'att', 'def', 'h2h', 'goals', 'total')
+
+
+def random_prediction():
+    home = tuple(round(random.random(), 2) for _ in FIELDS)
+    return Prediction('Home', 'Away', FIELDS, home, tuple(round(1 - value, 2) for value in home))
+
+
+def measure(use_template, iterations):
+    # The first call builds the template, so it isn't counted
+    create_wind_rose_by_predictions(random_prediction(), use_template=use_template)
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        create_wind_rose_by_predictions(random_prediction(), use_template=use_template)
+    return (time.perf_counter() - started) / iterations
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    fresh = measure(False, iterations)
+    template = measure(True, iterations)
+    print(f"fresh figure:    {fresh * 1000:.1f} ms/request")
+    print(f"cached template: {template * 1000:.1f} ms/request")
+    print(f"reduction:       {(1 - template / fresh) * 100:.0f}%")
+
+
+if __name__ == '__main__':
+    main()
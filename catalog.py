@@ -0,0 +1,87 @@
+import asyncio
+import logging
+
+from config import CATALOG_LEAGUES, CATALOG_SEASONS, CATALOG_SYNC_INTERVAL, CATALOG_MAX_AGE, CATALOG_CONCURRENCY, \
+    CATALOG_SYNC_ENABLED
+from football_api_getters import LEAGUES_DICT, SYNCED_LEAGUES, load_league_dict, get_season, fetch_teams, \
+    install_team_dict
+from metrics import inc
+from rate_limiter import BACKGROUND
+from storage import load_leagues, load_teams
+
+# Workers that don't sync pick up what the syncing one stored this often
+CATALOG_RELOAD_INTERVAL = 60 * 60
+
+
+def get_catalog_league_ids():
+    if CATALOG_LEAGUES.strip() == 'all':
+        return set(LEAGUES_DICT.values())
+    return {int(league_id) for league_id in CATALOG_LEAGUES.split(',') if league_id.strip()}
+
+
+def get_catalog_seasons(league, league_name):
+    if CATALOG_SEASONS.strip() == 'current':
+        return [get_season(league_name)]
+    return [int(year) for year in CATALOG_SEASONS.split(',') if year.strip() and int(year) in league['seasons']]
+
+
+def get_current_seasons():
+    return {league['id']: league['current_season'] for league in load_leagues() or []}
+
+
+def install_catalog():
+    # Every synced league is ready in memory, so picking one costs no request at all
+    league_ids = get_catalog_league_ids()
+    SYNCED_LEAGUES.update(league_ids)
+    for league_name, league_id in LEAGUES_DICT.items():
+        if league_id in league_ids:
+            teams_dict = load_teams(league_id, get_season(league_name))
+            if teams_dict is not None:
+                install_team_dict(league_name, teams_dict)
+
+
+async def sync_catalog():
+    # The league list is refetched once its TTL has passed; a league that moved on to a new season has new teams
+    seasons_before = get_current_seasons()
+    await load_league_dict()
+    changed = {league_id for league_id, season in get_current_seasons().items()
+               if seasons_before.get(league_id) != season}
+
+    league_ids = get_catalog_league_ids()
+    SYNCED_LEAGUES.update(league_ids)
+    leagues = {league['id']: league for league in load_leagues() or []}
+
+    # Only leagues whose season changed or whose stored teams are missing or old are fetched again
+    jobs = set()
+    for league_name, league_id in LEAGUES_DICT.items():
+        if league_id in league_ids and league_id in leagues:
+            for season in get_catalog_seasons(leagues[league_id], league_name):
+                if league_id in changed or load_teams(league_id, season, CATALOG_MAX_AGE) is None:
+                    jobs.add((league_id, season))
+
+    semaphore = asyncio.Semaphore(CATALOG_CONCURRENCY)
+
+    async def sync(league_id, season):
+        async with semaphore:
+            teams_dict = await fetch_teams(league_id, season, priority=BACKGROUND, refresh=True)
+        inc('catalog_syncs_total', result='synced' if teams_dict is not None else 'failed')
+
+    await asyncio.gather(*(sync(league_id, season) for league_id, season in sorted(jobs)))
+    logging.info("Catalog synced: %d of %d leagues fetched", len({league_id for league_id, _ in jobs}),
+                 len(league_ids))
+    install_catalog()
+
+
+async def run_catalog_sync():
+    while True:
+        try:
+            if CATALOG_SYNC_ENABLED:
+                await sync_catalog()
+            else:
+                await load_league_dict()
+                install_catalog()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.exception("Catalog sync failed: %s", e)
+        await asyncio.sleep(CATALOG_SYNC_INTERVAL if CATALOG_SYNC_ENABLED else CATALOG_RELOAD_INTERVAL)
@@ -5,6 +5,8 @@ from dotenv import load_dotenv
 load_dotenv('.env')
 
 TELE_TOKEN = os.getenv("TELE_TOKEN")
+# Alternative Bot API server, e.g. a local one or the fake used by the benchmarks
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", '')
 RAPIDAPI_TOKEN = os.getenv("RAPIDAPI_TOKEN")
 
 FOOTBALL_API_HEADERS = {
@@ -12,5 +14,148 @@ FOOTBALL_API_HEADERS = {
     'X-RapidAPI-Host': 'api-football-v1.p.rapidapi.com'
 }
 
+# Legacy league list, imported into the store on first start
 LEAGUE_DICT_PATH = 'memory/leagues.json'
-TEAM_DICT_PATH = 'memory/teams.json'
+STORE_PATH = os.getenv("STORE_PATH", 'memory/football.sqlite3')
+
+FOOTBALL_API_URL = os.getenv("FOOTBALL_API_URL", 'https://api-football-v1.p.rapidapi.com/v3')
+
+# Shared HTTP connection pool for the football API
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", 10))
+API_MAX_CONNECTIONS = int(os.getenv("API_MAX_CONNECTIONS", 20))
+API_MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", 10))
+API_KEEPALIVE_TIMEOUT = float(os.getenv("API_KEEPALIVE_TIMEOUT", 30))
+
+# Football API response cache: TTL in seconds per endpoint, live fixtures get their own short TTL
+API_CACHE_TTLS = {
+    'leagues': 24 * 60 * 60,
+    'teams': 12 * 60 * 60,
+    'players/squads': 12 * 60 * 60,
+    'standings': 30 * 60,
+    'fixtures': 10 * 60,
+    'predictions': 60 * 60
+}
+API_CACHE_LIVE_TTL = int(os.getenv("API_CACHE_LIVE_TTL", 15))
+# How long past its TTL a response may still be served to users while it is refreshed (live fixtures never are)
+API_CACHE_MAX_STALE = {
+    'leagues': 7 * 24 * 60 * 60,
+    'teams': 7 * 24 * 60 * 60,
+    'players/squads': 3 * 24 * 60 * 60,
+    'standings': 6 * 60 * 60,
+    'fixtures': 60 * 60,
+    'predictions': 6 * 60 * 60
+}
+API_CACHE_MAX_ENTRIES = int(os.getenv("API_CACHE_MAX_ENTRIES", 2048))
+API_CACHE_MAX_BYTES = int(os.getenv("API_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Process pool used for matplotlib rendering
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", os.cpu_count() or 1))
+RENDER_QUEUE_SIZE = int(os.getenv("RENDER_QUEUE_SIZE", 4 * RENDER_WORKERS))
+RENDER_QUEUE_TIMEOUT = float(os.getenv("RENDER_QUEUE_TIMEOUT", 30))
+
+# Encoding of rendered images: 'png', 'jpeg' or 'webp'; quality applies to the lossy formats
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", 'jpeg').lower()
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", 90))
+
+# Rendered image cache, set IMAGE_CACHE_DIR to keep images across restarts
+IMAGE_CACHE_MAX_ENTRIES = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", 512))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", '')
+# Size cap of IMAGE_CACHE_DIR, the least recently used images are deleted beyond it
+IMAGE_CACHE_DIR_MAX_BYTES = int(os.getenv("IMAGE_CACHE_DIR_MAX_BYTES", 512 * 1024 * 1024))
+
+# Telegram file_id of every uploaded image, keyed by content fingerprint
+FILE_ID_CACHE_MAX_ENTRIES = int(os.getenv("FILE_ID_CACHE_MAX_ENTRIES", 4096))
+
+# Start polling before the league list and render workers are loaded
+FAST_START = os.getenv("FAST_START", '1') == '1'
+
+# Per-chat league/team selection
+SESSION_MAX_CHATS = int(os.getenv("SESSION_MAX_CHATS", 100000))
+SESSION_IDLE_TIMEOUT = int(os.getenv("SESSION_IDLE_TIMEOUT", 6 * 60 * 60))
+TEAM_DICT_TTL = int(os.getenv("TEAM_DICT_TTL", 12 * 60 * 60))
+
+# Live match push updates
+LIVE_POLL_INTERVAL = float(os.getenv("LIVE_POLL_INTERVAL", 30))
+LIVE_SEND_CONCURRENCY = int(os.getenv("LIVE_SEND_CONCURRENCY", 20))
+
+# Table rendering engine: 'matplotlib' or 'pillow' (the wind rose always uses matplotlib)
+RENDER_ENGINE = os.getenv("RENDER_ENGINE", 'matplotlib')
+PIL_FONT_PATH = os.getenv("PIL_FONT_PATH", 'DejaVuSans.ttf')
+
+# Reuse one prediction wind rose figure per set of comparison fields
+WIND_ROSE_TEMPLATES = os.getenv("WIND_ROSE_TEMPLATES", '1') == '1'
+WIND_ROSE_TEMPLATES_MAX = int(os.getenv("WIND_ROSE_TEMPLATES_MAX", 4))
+
+# Football API pacing and quota budgeting
+API_RATE_LIMIT_PER_MINUTE = int(os.getenv("API_RATE_LIMIT_PER_MINUTE", 300))
+API_BURST = int(os.getenv("API_BURST", 10))
+API_INTERACTIVE_RESERVE_TOKENS = int(os.getenv("API_INTERACTIVE_RESERVE_TOKENS", 3))
+# Share of the daily quota background jobs never touch, and the share below which stale cache is preferred
+API_BACKGROUND_QUOTA_RESERVE = float(os.getenv("API_BACKGROUND_QUOTA_RESERVE", 0.3))
+API_LOW_QUOTA_THRESHOLD = float(os.getenv("API_LOW_QUOTA_THRESHOLD", 0.1))
+# Once the daily quota is used up, one request this often finds out whether it has been reset early
+API_QUOTA_PROBE_INTERVAL = float(os.getenv("API_QUOTA_PROBE_INTERVAL", 15 * 60))
+
+# Circuit breaker around the football API
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", 30))
+
+# 'polling' or 'webhook'
+BOT_MODE = os.getenv("BOT_MODE", 'polling')
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", '/webhook')
+# Public base URL registered with Telegram on startup, leave empty when testing locally
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", '')
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", '')
+WEBHOOK_MAX_IN_FLIGHT = int(os.getenv("WEBHOOK_MAX_IN_FLIGHT", 100))
+WEBHOOK_SHUTDOWN_TIMEOUT = float(os.getenv("WEBHOOK_SHUTDOWN_TIMEOUT", 30))
+
+# Sharded multi-process mode (run workers.py): number of bot workers and updates each handles at once
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", os.cpu_count() or 1))
+WORKER_MAX_IN_FLIGHT = int(os.getenv("WORKER_MAX_IN_FLIGHT", 100))
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", 1000))
+# Failed getUpdates calls are retried after a delay that doubles up to this many seconds
+POLLING_MAX_RETRY_DELAY = float(os.getenv("POLLING_MAX_RETRY_DELAY", 60))
+# Share API responses and Telegram file ids between processes through the local store
+SHARED_CACHE = os.getenv("SHARED_CACHE", '0') == '1'
+# Expired shared cache rows are deleted this often
+SHARED_CACHE_PRUNE_INTERVAL = float(os.getenv("SHARED_CACHE_PRUNE_INTERVAL", 10 * 60))
+LIVE_POLLER_ENABLED = os.getenv("LIVE_POLLER_ENABLED", '1') == '1'
+
+# Prometheus-style metrics served on http://METRICS_HOST:METRICS_PORT/metrics, 0 turns the endpoint off
+METRICS_HOST = os.getenv("METRICS_HOST", '127.0.0.1')
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+# Sampling profiler on the metrics port: /debug/profile?seconds=10 returns collapsed stacks
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", '0') == '1'
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", 0.005))
+
+# Background pre-warming of the most requested league tables and team forms
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", '1') == '1'
+PREWARM_LEAGUES = int(os.getenv("PREWARM_LEAGUES", 10))
+PREWARM_TEAMS = int(os.getenv("PREWARM_TEAMS", 20))
+# Refresh them a bit more often than their caches expire (standings and fixtures), and again once a match of
+# theirs has finished
+PREWARM_INTERVAL = float(os.getenv("PREWARM_INTERVAL", 25 * 60))
+PREWARM_TEAM_INTERVAL = float(os.getenv("PREWARM_TEAM_INTERVAL", 8 * 60))
+PREWARM_FINISHED_DELAY = float(os.getenv("PREWARM_FINISHED_DELAY", 10 * 60))
+# Request counts halve over this period, so yesterday's favourites fade out
+PREWARM_HALF_LIFE = float(os.getenv("PREWARM_HALF_LIFE", 24 * 60 * 60))
+# Share of the daily API quota the pre-warmer may spend
+PREWARM_QUOTA_SHARE = float(os.getenv("PREWARM_QUOTA_SHARE", 0.1))
+
+# Bulk team catalog: league ids (comma separated, or 'all') whose teams are synced up front, and their seasons
+# ('current' or comma separated years). Leave empty to fetch teams when a league is first picked
+CATALOG_LEAGUES = os.getenv("CATALOG_LEAGUES", '')
+CATALOG_SEASONS = os.getenv("CATALOG_SEASONS", 'current')
+CATALOG_SYNC_INTERVAL = float(os.getenv("CATALOG_SYNC_INTERVAL", 24 * 60 * 60))
+# Team lists barely change within a season, unchanged leagues are refetched only after this long
+CATALOG_MAX_AGE = float(os.getenv("CATALOG_MAX_AGE", 7 * 24 * 60 * 60))
+CATALOG_CONCURRENCY = int(os.getenv("CATALOG_CONCURRENCY", 4))
+# With several bot workers only one of them fetches, the others load the synced teams from the store
+CATALOG_SYNC_ENABLED = os.getenv("CATALOG_SYNC_ENABLED", '1') == '1'
+
+# Comparing several matches at once: at most this many (a Telegram album holds 10), fetched this many at a time
+PREDICTION_BATCH_MAX = int(os.getenv("PREDICTION_BATCH_MAX", 10))
+PREDICTION_BATCH_CONCURRENCY = int(os.getenv("PREDICTION_BATCH_CONCURRENCY", 4))
@@ -1,156 +1,307 @@
+import asyncio
 import json
 import os
+import time
+from collections import Counter
 from datetime import datetime
 
-import requests
-import pandas as pd
+from api_client import api_get, get_cached, cache_response
+from config import LEAGUE_DICT_PATH, TEAM_DICT_TTL, API_CACHE_TTLS, PREDICTION_BATCH_CONCURRENCY
+from metrics import span, timed, inc
+from name_index import NameIndex
+from rate_limiter import INTERACTIVE
+from records import Standing, FormResult, Player, LiveMatch, Prediction
+from storage import load_leagues, save_leagues, load_teams, save_teams, load_standings, save_standings, \
+    load_squad, save_squad, save_fixtures, load_fixture, save_prediction, load_prediction, save_in_background
+
+
+def store_fixtures(data):
+    # Only called with what the upstream just returned, cache hits are already stored
+    save_in_background(save_fixtures, data['response'])
+
+
+async def fetch_stored(endpoint, params, load, save, priority=INTERACTIVE, refresh=False):
+    # The response cache answers first. Rows still fresh in the local store come next, they carry a restart
+    # or another bot worker's fetch without touching the API
+    if not refresh:
+        data = get_cached(endpoint, params)
+        if data is not None:
+            return 200, data
+        with span('store_load', endpoint=endpoint):
+            data = load(API_CACHE_TTLS[endpoint])
+        if data is not None:
+            inc('football_api_cache_total', endpoint=endpoint, result='store')
+            return 200, data
 
-from config import FOOTBALL_API_HEADERS, LEAGUE_DICT_PATH, TEAM_DICT_PATH
-from image_makers import create_players_table, create_result_table, create_wind_rose_by_predictions
-from string_transformers import create_current_matches_string
-
-
-def get_league_dict():
-    if os.path.exists(LEAGUE_DICT_PATH):
-        f = open(LEAGUE_DICT_PATH, 'r')
-        tmp = ''.join(f.readlines())
-        f.close()
-        return json.loads(tmp)
+    try:
+        status, data = await api_get(endpoint, params, priority=priority, refresh=refresh,
+                                     on_fetch=lambda data: save_in_background(save, data))
+    except Exception as e:
+        status, data = None, e
+
+    if status == 200:
+        return status, data
+
+    # The upstream is failing, the last stored result is better than nothing
+    stored = load(None)
+    if stored is not None:
+        return 200, stored
+    if isinstance(data, Exception):
+        raise data
+    return status, data
+
+
+def import_legacy_leagues():
+    f = open(LEAGUE_DICT_PATH, 'r')
+    leagues = json.load(f)
+    f.close()
+
+    # Older files only kept a name -> id mapping
+    if isinstance(leagues, dict):
+        leagues = [{"id": league_id, "name": league_name, "country": None, "seasons": [], "current_season": None}
+                   for league_name, league_id in leagues.items()]
+    save_in_background(save_leagues, leagues)
+    return leagues
+
+
+@timed('parse_leagues')
+def parse_leagues(data):
+    # Create a list to store league names, IDs, countries and seasons
+    leagues = []
+
+    # Iterate through each league in the response
+    for league in data['response']:
+        seasons = [season['year'] for season in league.get('seasons', [])]
+        leagues.append({
+            "id": league['league']['id'],
+            "name": league['league']['name'],
+            "country": league['country']['name'],
+            "seasons": seasons,
+            "current_season": next((season['year'] for season in league.get('seasons', []) if season.get('current')),
+                                   max(seasons, default=None))
+        })
+
+    return leagues
+
+
+async def get_leagues():
+    leagues = load_leagues(API_CACHE_TTLS['leagues'])
+    if leagues is not None:
+        return leagues
+
+    stale_leagues = load_leagues()
+    if stale_leagues is None and os.path.exists(LEAGUE_DICT_PATH):
+        return import_legacy_leagues()
 
     # Endpoint for retrieving all available leagues
-    url = "https://api-football-v1.p.rapidapi.com/v3/leagues"
+    endpoint = 'leagues'
 
     try:
         # Make GET request to the API endpoint
-        response = requests.get(url, headers=FOOTBALL_API_HEADERS)
+        status, data = await api_get(endpoint)
 
         # Check if request was successful (status code 200)
-        if response.status_code == 200:
-            # Parse JSON response
-            data = response.json()
+        if status == 200:
+            leagues = parse_leagues(data)
+            save_in_background(save_leagues, leagues)
+            return leagues
+
+        else:
+            print("Failed to retrieve league data. Status code:", status)
+            return stale_leagues
+
+    except Exception as e:
+        print("An error occurred:", e)
+        return stale_leagues
 
-            # Create a dictionary to store league names and IDs
-            league_dict = {}
 
-            # Iterate through each league in the response
-            for league in data['response']:
-                # Extract league name and ID
-                league_name = league['league']['name']
-                league_id = league['league']['id']
+def get_league_key(league, name_counts):
+    # Many leagues share a name ("Premier League", "Cup"), so duplicates are qualified by country
+    if name_counts[league['name']] == 1:
+        return league['name']
+    if league['country']:
+        return f"{league['name']} ({league['country']})"
+    return f"{league['name']} #{league['id']}"
 
-                # Add league name and ID to the dictionary
-                league_dict[league_name] = league_id
 
-            f = open(LEAGUE_DICT_PATH, 'w')
-            f.write(json.dumps(league_dict))
-            f.close()
-            return league_dict
+LEAGUES_DICT = {}
+LEAGUE_SEASONS = {}
+LEAGUE_INDEX = NameIndex()
 
-        else:
-            print("Failed to retrieve league data. Status code:", response.status_code)
-            return None
 
-    except Exception as e:
-        print("An error occurred:", e)
-        return None
+async def load_league_dict():
+    global LEAGUE_INDEX
 
+    leagues = await get_leagues()
+    if not leagues:
+        # Keep what is loaded rather than emptying the catalog
+        return
 
-LEAGUES_DICT = get_league_dict()
+    # Reloads build everything anew and swap it in, leagues gone from the list go with it
+    leagues_dict = {}
+    league_seasons = {}
+    league_index = NameIndex()
+    name_counts = Counter(league['name'] for league in leagues)
+    for league in leagues:
+        key = get_league_key(league, name_counts)
+        leagues_dict[key] = league['id']
+        league_seasons[key] = league.get('current_season')
+        league_index.add(league['name'], key, league['id'], league['country'], league['seasons'])
 
+    # Both dicts are imported by other modules, so they're updated in place
+    LEAGUES_DICT.clear()
+    LEAGUES_DICT.update(leagues_dict)
+    LEAGUE_SEASONS.clear()
+    LEAGUE_SEASONS.update(league_seasons)
+    LEAGUE_INDEX = league_index
 
-def get_teams_dict(league_name):
 
-    url = 'https://api-football-v1.p.rapidapi.com/v3/teams'
+def find_leagues(text):
+    return LEAGUE_INDEX.find(text)
+
+
+def get_season(league_name):
+    # Leagues imported from the legacy name -> id file don't know their seasons
+    return LEAGUE_SEASONS.get(league_name) or datetime.now().year - 1
+
+
+@timed('parse_teams')
+def parse_teams(data):
+    # Create a dictionary to store team names and IDs
+    teams_dict = {}
+
+    # Iterate through each team in the response
+    for team in data['response']:
+        # Extract team name and ID
+        team_name = team['team']['name']
+        team_id = team['team']['id']
+
+        # Add team name and ID to the dictionary
+        teams_dict[team_name] = team_id
+
+    return teams_dict
+
+
+# Leagues kept up to date by the catalog sync, their stored teams are used whatever their age
+SYNCED_LEAGUES = set()
+
+
+async def fetch_teams(league_id, season, priority=INTERACTIVE, refresh=False):
+
+    endpoint = 'teams'
 
     params = {
-        'league': LEAGUES_DICT[league_name],
-        'season': datetime.now().year-1
+        'league': league_id,
+        'season': season
     }
 
+    if not refresh:
+        max_age = None if league_id in SYNCED_LEAGUES else API_CACHE_TTLS['teams']
+        teams_dict = load_teams(params['league'], params['season'], max_age)
+        if teams_dict is not None:
+            return teams_dict
+
     try:
         # Make GET request to the API endpoint
-        response = requests.get(url, headers=FOOTBALL_API_HEADERS, params=params)
+        status, data = await api_get(
+            endpoint, params, priority=priority, refresh=refresh,
+            on_fetch=lambda data: save_in_background(save_teams, params['league'], params['season'],
+                                                     parse_teams(data)))
 
         # Check if request was successful (status code 200)
-        if response.status_code == 200:
-            # Parse JSON response
-            data = response.json()
+        if status == 200:
+            return parse_teams(data)
 
-            # Create a dictionary to store team names and IDs
-            teams_dict = {}
+        else:
+            print("Failed to retrieve teams data. Status code:", status)
+            return load_teams(params['league'], params['season'])
 
-            # Iterate through each team in the response
-            for team in data['response']:
-                # Extract team name and ID
-                team_name = team['team']['name']
-                team_id = team['team']['id']
+    except Exception as e:
+        print("An error occurred:", e)
+        return load_teams(params['league'], params['season'])
 
-                # Add team name and ID to the dictionary
-                teams_dict[team_name] = team_id
 
-            return teams_dict
+async def get_teams_dict(league_name, priority=INTERACTIVE):
+    return await fetch_teams(LEAGUES_DICT[league_name], get_season(league_name), priority)
 
-        else:
-            print("Failed to retrieve teams data. Status code:", response.status_code)
-            return None
 
-    except Exception as e:
-        print("An error occurred:", e)
-        return None
+# Team dictionaries are shared by every chat that picked the same league
+TEAMS_BY_LEAGUE = {}
+TEAMS_UPDATED_AT = {}
+TEAM_INDEXES = {}
+
+
+async def update_team_dict(league_name, priority=INTERACTIVE):
+    updated_at = TEAMS_UPDATED_AT.get(league_name)
+    if updated_at is not None and time.monotonic() - updated_at < TEAM_DICT_TTL:
+        return TEAMS_BY_LEAGUE[league_name]
+
+    teams_dict = await get_teams_dict(league_name, priority)
+    if teams_dict is not None:
+        install_team_dict(league_name, teams_dict)
+    return TEAMS_BY_LEAGUE.get(league_name, {})
+
+
+def install_team_dict(league_name, teams_dict):
+    team_index = NameIndex()
+    for team_name, team_id in teams_dict.items():
+        team_index.add(team_name, team_name, team_id)
 
+    TEAMS_BY_LEAGUE[league_name] = teams_dict
+    TEAM_INDEXES[league_name] = team_index
+    TEAMS_UPDATED_AT[league_name] = time.monotonic()
 
-TEAMS_DICT = {}
 
+def get_team_dict(league_name):
+    return TEAMS_BY_LEAGUE.get(league_name, {})
 
-def update_team_dict(league_name):
-    global TEAMS_DICT
-    TEAMS_DICT = get_teams_dict(league_name)
 
+def find_teams(league_name, text):
+    team_index = TEAM_INDEXES.get(league_name)
+    return team_index.find(text) if team_index is not None else []
 
-def get_team_dict():
-    return TEAMS_DICT
 
+@timed('parse_standings')
+def parse_standings(data):
+    standings = data['response'][0]['league']['standings'][0]
 
-def get_league_table(league_name):
+    # Build one compact row per team
+    table_data = []
+    for team in standings:
+        table_data.append(Standing(
+            position=team['rank'],
+            team=team['team']['name'],
+            matches=team['all']['played'],
+            won=team['all']['win'],
+            draw=team['all']['draw'],
+            lost=team['all']['lose'],
+            points=team['points']
+        ))
+
+    return table_data
+
+
+async def get_league_table(league_name, priority=INTERACTIVE, refresh=False):
 
     league_id = LEAGUES_DICT[league_name]
 
-    endpoint = f"https://api-football-v1.p.rapidapi.com/v3/standings"
+    endpoint = 'standings'
     params = {
-        "season": datetime.now().year-1,
+        "season": get_season(league_name),
         "league": league_id
     }
 
     try:
-        response = requests.get(endpoint, headers=FOOTBALL_API_HEADERS, params=params)
-        data = response.json()
-
-        f = open('tmp.txt', 'w')
-        f.write(json.dumps(data))
-        f.close()
+        status, data = await fetch_stored(
+            endpoint, params,
+            lambda max_age: load_standings(league_id, params['season'], max_age),
+            lambda data: save_standings(league_id, params['season'], data),
+            priority, refresh)
 
         # Check if the request was successful
-        if response.status_code == 200:
+        if status == 200:
             if data['response']:
-                standings = data['response'][0]['league']['standings'][0]
-
-                # Prepare data for the DataFrame
-                table_data = []
-                for team in standings:
-                    position = team['rank']
-                    team_name = team['team']['name']
-                    matches = team['all']['played']
-                    won = team['all']['win']
-                    draw = team['all']['draw']
-                    lost = team['all']['lose']
-                    points = team['points']
-                    table_data.append(
-                        {"Position": position, "Team": team_name, "Matches": matches, "Won": won, "Draw": draw,
-                         "Lost": lost, "Points": points})
-
-                # Create DataFrame
-                df = pd.DataFrame(table_data)
-                return df
+                return parse_standings(data)
             else:
                 print("No standings found for the given league.")
                 return None
@@ -172,54 +323,134 @@ def determine_result(scoreline):
         return "L"
 
 
-def get_team_form(team_name):
-    url = "https://api-football-v1.p.rapidapi.com/v3/fixtures"
+@timed('parse_team_form')
+def parse_team_form(data, team_name):
+    # Extract recent results
+    form_data = []
+    for fixture in data['response']:
+        home_team = fixture['teams']['home']['name']
+        away_team = fixture['teams']['away']['name']
+        home_goals = fixture['goals']['home']
+        away_goals = fixture['goals']['away']
+
+        result = ""
+        opponent_team = ""
+
+        if team_name == home_team:
+            opponent_team = away_team
+            result = f"{home_goals}:{away_goals}"
+        elif team_name == away_team:
+            opponent_team = home_team
+            result = f"{away_goals}:{home_goals}"
+
+        # Add "W/D/L" outcome
+        form_data.append(FormResult(result, opponent_team, determine_result(result)))
+
+    return form_data
+
+
+async def get_team_form(league_name, team_name, priority=INTERACTIVE, refresh=False):
+    endpoint = 'fixtures'
 
     params = {
-        "team": TEAMS_DICT[team_name],
+        "team": TEAMS_BY_LEAGUE[league_name][team_name],
         "last": 10
     }
 
     try:
         # Make GET request to the API endpoint
-        response = requests.get(url, headers=FOOTBALL_API_HEADERS, params=params)
+        status, data = await api_get(endpoint, params, priority=priority, refresh=refresh, on_fetch=store_fixtures)
+
+        # Check if request was successful (status code 200)
+        if status == 200:
+            return parse_team_form(data, team_name)
+
+        else:
+            print("Failed to retrieve team form. Status code:", status)
+            return None
+
+    except Exception as e:
+        print("An error occurred:", e)
+        return None
+
+
+@timed('parse_players')
+def parse_players(data):
+    # Extract player information
+    players_info = []
+    for player in data['response'][0]['players']:
+        players_info.append(Player(
+            number=player.get('number', ''),
+            position=player.get('position', ''),
+            name=player.get('name', ''),
+            age=player.get('age', '')
+        ))
+
+    return players_info
+
+
+async def get_team_players(league_name, team_name):
+    endpoint = 'players/squads'
+
+    params = {
+        "team": TEAMS_BY_LEAGUE[league_name][team_name]
+    }
+
+    try:
+        # Make GET request to the API endpoint
+        status, data = await fetch_stored(
+            endpoint, params,
+            lambda max_age: load_squad(params['team'], max_age),
+            lambda data: save_squad(params['team'], data))
 
         # Check if request was successful (status code 200)
-        if response.status_code == 200:
-            # Parse JSON response
-            data = response.json()
+        if status == 200:
+            return parse_players(data)
+
+        else:
+            print("Failed to retrieve team players. Status code:", status)
+            return None
+
+    except Exception as e:
+        print("An error occurred:", e)
+        return None
 
-            # Extract recent results
-            fixtures = data['response']
-            form_data = []
-            for fixture in fixtures:
-                home_team = fixture['teams']['home']['name']
-                away_team = fixture['teams']['away']['name']
-                home_goals = fixture['goals']['home']
-                away_goals = fixture['goals']['away']
 
-                result = ""
-                opponent_team = ""
+def get_live_params(league_ids):
+    # A single league is still sent as a range, which is what the endpoint expects
+    if len(league_ids) == 1:
+        return {"live": f'{league_ids[0]}-{league_ids[0]}'}
+    return {"live": '-'.join(str(league_id) for league_id in league_ids)}
 
-                if team_name == home_team:
-                    opponent_team = away_team
-                    result = f"{home_goals}:{away_goals}"
-                elif team_name == away_team:
-                    opponent_team = home_team
-                    result = f"{away_goals}:{home_goals}"
 
-                form_data.append({"result": result, "opponent_team": opponent_team})
+def group_by_league(fixtures, league_ids):
+    fixtures_by_league = {league_id: [] for league_id in league_ids}
+    for fixture in fixtures:
+        fixtures_by_league.setdefault(fixture['league']['id'], []).append(fixture)
+    return fixtures_by_league
 
-            # Create DataFrame from form_data
-            df = pd.DataFrame(form_data)
 
-            # Add "W/D/L" column
-            df['W/D/L'] = df['result'].apply(lambda x: determine_result(x))
+async def get_live_fixtures_by_leagues(league_ids, priority=INTERACTIVE):
+    league_ids = sorted(set(league_ids))
+    endpoint = 'fixtures'
 
-            return df
+    def on_fetch(data):
+        store_fixtures(data)
+        # Fill the per-league entries so single-league lookups are served from memory. Only with data just
+        # fetched, a cached batch would come back with a fresh TTL
+        if len(league_ids) > 1:
+            for league_id, fixtures in group_by_league(data['response'], league_ids).items():
+                cache_response(endpoint, get_live_params([league_id]), {"response": fixtures})
+
+    try:
+        # One request for all leagues
+        status, data = await api_get(endpoint, get_live_params(league_ids), priority=priority, on_fetch=on_fetch)
+
+        if status == 200:
+            return group_by_league(data['response'], league_ids)
 
         else:
-            print("Failed to retrieve team form. Status code:", response.status_code)
+            print("Failed to retrieve live fixtures. Status code:", status)
             return None
 
     except Exception as e:
@@ -227,41 +458,72 @@ def get_team_form(team_name):
         return None
 
 
-def get_team_players(team_name):
-    url = 'https://api-football-v1.p.rapidapi.com/v3/players/squads'
+# The fixtures endpoint takes at most this many ids per request
+FIXTURE_IDS_PER_REQUEST = 20
 
-    params = {
-        "team": TEAMS_DICT[team_name]
-    }
+
+async def get_fixtures_by_ids(fixture_ids, priority=INTERACTIVE, refresh=False):
+    endpoint = 'fixtures'
+    fixture_ids = sorted(set(int(fixture_id) for fixture_id in fixture_ids))
+
+    fixtures = []
+    for start in range(0, len(fixture_ids), FIXTURE_IDS_PER_REQUEST):
+        params = {
+            "ids": '-'.join(str(fixture_id) for fixture_id in fixture_ids[start:start + FIXTURE_IDS_PER_REQUEST])
+        }
+
+        try:
+            # Make GET request to the API endpoint
+            status, data = await api_get(endpoint, params, priority=priority, refresh=refresh,
+                                         on_fetch=store_fixtures)
+
+            # Check if request was successful (status code 200)
+            if status == 200:
+                fixtures.extend(data['response'])
+
+            else:
+                print("Failed to retrieve fixtures. Status code:", status)
+                return None
+
+        except Exception as e:
+            print("An error occurred:", e)
+            return None
+
+    return fixtures
+
+
+@timed('parse_live_matches')
+def parse_live_matches(data):
+    # Extract current matches data
+    matches_info = []
+    for match in data['response']:
+        match_id = match['fixture']['id']
+        teams = f"{match['teams']['home']['name']} vs {match['teams']['away']['name']}"
+        current_result = match['goals']['home'] if match['goals']['home'] is not None else 0, match['goals'][
+            'away'] if match['goals']['away'] is not None else 0
+        half = match['fixture']['status']['short']
+        time = match['fixture']['status']['elapsed']
+
+        matches_info.append(LiveMatch(match_id, teams, f"{current_result[0]}:{current_result[1]}", half, time))
+
+    return matches_info
+
+
+async def get_current_matches_by_league(league_name):
+    endpoint = 'fixtures'
+
+    params = get_live_params([LEAGUES_DICT[league_name]])
 
     try:
         # Make GET request to the API endpoint
-        response = requests.get(url, headers=FOOTBALL_API_HEADERS, params=params)
+        status, data = await api_get(endpoint, params, on_fetch=store_fixtures)
 
         # Check if request was successful (status code 200)
-        if response.status_code == 200:
-            # Parse JSON response
-            data = response.json()
-
-            # Extract player information
-            players_data = data['response'][0]['players']
-            players_info = []
-            for player in players_data:
-                player_info = {
-                    "number": player.get('number', ''),
-                    "position": player.get('position', ''),
-                    "name": player.get('name', ''),
-                    "age": player.get('age', '')
-                }
-                players_info.append(player_info)
-
-            # Create DataFrame from players_info
-            df = pd.DataFrame(players_info)
-
-            return df
+        if status == 200:
+            return parse_live_matches(data)
 
         else:
-            print("Failed to retrieve team players. Status code:", response.status_code)
+            print("Failed to retrieve current matches. Status code:", status)
             return None
 
     except Exception as e:
@@ -269,48 +531,74 @@ def get_team_players(team_name):
         return None
 
 
-def get_current_matches_by_league(league_name):
-    url = 'https://api-football-v1.p.rapidapi.com/v3/fixtures'
+@timed('parse_prediction')
+def parse_prediction(data):
+    # Extract predictions data
+    predictions_data = data['response'][0]
+
+    # Extract teams
+    home_team = predictions_data['teams']['home']['name']
+    away_team = predictions_data['teams']['away']['name']
+
+    # Extract comparison fields
+    comparison_fields = list(predictions_data['comparison'].keys())
+    comparison_fields.remove('poisson_distribution')
+    # Extract predictions, remove percent sign, and convert to decimal format
+    home_predictions = []
+    away_predictions = []
+    for field in comparison_fields:
+        home_pred_str = predictions_data['comparison'][field]['home']  # Get prediction as string
+        away_pred_str = predictions_data['comparison'][field]['away']  # Get prediction as string
+        home_pred = float(home_pred_str.rstrip('%')) / 100  # Remove percent sign and convert to decimal
+        away_pred = float(away_pred_str.rstrip('%')) / 100  # Remove percent sign and convert to decimal
+        home_predictions.append(home_pred)
+        away_predictions.append(away_pred)
+
+    return Prediction(home_team, away_team, tuple(comparison_fields), tuple(home_predictions),
+                      tuple(away_predictions))
+
+
+def get_prediction_expiry(fixture):
+    # A prediction doesn't change before kickoff
+    kickoff = fixture['fixture'].get('timestamp') if fixture is not None else None
+    if kickoff and kickoff > time.time():
+        return kickoff
+    return time.time() + API_CACHE_TTLS['predictions']
+
+
+async def get_kickoff_fixtures(fixture_ids, fixtures=None):
+    """Fixtures by id, for their kickoff times: the given ones, the stored ones and one lookup for the rest."""
+    fixtures = dict(fixtures or {})
+    for fixture_id in fixture_ids:
+        if fixture_id not in fixtures:
+            fixture = load_fixture(fixture_id)
+            if fixture is not None:
+                fixtures[fixture_id] = fixture
+
+    unknown = [fixture_id for fixture_id in fixture_ids if fixture_id not in fixtures]
+    if unknown:
+        for fixture in await get_fixtures_by_ids(unknown) or []:
+            fixtures[fixture['fixture']['id']] = fixture
+    return fixtures
+
+
+async def fetch_prediction(fixture_id):
+    endpoint = 'predictions'
 
     params = {
-        "live": f'{LEAGUES_DICT[league_name]}-{LEAGUES_DICT[league_name]}'
+        "fixture": fixture_id
     }
 
     try:
         # Make GET request to the API endpoint
-        response = requests.get(url, headers=FOOTBALL_API_HEADERS, params=params)
+        status, data = await api_get(endpoint, params)
 
         # Check if request was successful (status code 200)
-        if response.status_code == 200:
-            # Parse JSON response
-            data = response.json()
-
-            # Extract current matches data
-            matches_data = data['response']
-            matches_info = []
-            for match in matches_data:
-                match_id = match['fixture']['id']
-                teams = f"{match['teams']['home']['name']} vs {match['teams']['away']['name']}"
-                current_result = match['goals']['home'] if match['goals']['home'] is not None else 0, match['goals'][
-                    'away'] if match['goals']['away'] is not None else 0
-                half = match['fixture']['status']['short']
-                time = match['fixture']['status']['elapsed']
-
-                matches_info.append({
-                    "id": match_id,
-                    "teams": teams,
-                    "current_result": f"{current_result[0]}:{current_result[1]}",
-                    "half": half,
-                    "time (in minutes)": time
-                })
-
-            # Create DataFrame from matches_info
-            df = pd.DataFrame(matches_info)
-
-            return df
+        if status == 200:
+            return data, parse_prediction(data)
 
         else:
-            print("Failed to retrieve current matches. Status code:", response.status_code)
+            print("Failed to retrieve predictions. Status code:", status)
             return None
 
     except Exception as e:
@@ -318,53 +606,59 @@ def get_current_matches_by_league(league_name):
         return None
 
 
-def get_prediction_by_fixture_id(fixture_id):
-    url = 'https://api-football-v1.p.rapidapi.com/v3/predictions'
+async def get_prediction_by_fixture_id(fixture_id):
+    return (await get_predictions_by_fixture_ids([fixture_id]))[0]
+
+
+async def get_predictions_by_fixture_ids(fixture_ids, fixtures=None):
+    """Predictions in the order of `fixture_ids`, None where there is none; `fixtures` are payloads already at hand."""
+    fixture_ids = [int(fixture_id) for fixture_id in fixture_ids]
+
+    predictions = {}
+    for fixture_id in fixture_ids:
+        data = load_prediction(fixture_id)
+        if data is not None:
+            predictions[fixture_id] = parse_prediction(data)
+
+    missing = [fixture_id for fixture_id in dict.fromkeys(fixture_ids) if fixture_id not in predictions]
+    if missing:
+        # A whole matchday at once, with a bounded number of requests in flight
+        semaphore = asyncio.Semaphore(PREDICTION_BATCH_CONCURRENCY)
+
+        async def fetch(fixture_id):
+            async with semaphore:
+                return await fetch_prediction(fixture_id)
+
+        # Kickoffs are looked up while the predictions are fetched, each is kept until its match starts
+        kickoffs, fetched = await asyncio.gather(get_kickoff_fixtures(missing, fixtures),
+                                                 asyncio.gather(*(fetch(fixture_id) for fixture_id in missing)))
+        for fixture_id, result in zip(missing, fetched):
+            if result is not None:
+                data, predictions[fixture_id] = result
+                save_in_background(save_prediction, fixture_id, data, get_prediction_expiry(kickoffs.get(fixture_id)))
+
+    return [predictions.get(fixture_id) for fixture_id in fixture_ids]
+
+
+async def get_next_fixtures(league_name, count):
+    endpoint = 'fixtures'
 
     params = {
-        "fixture": fixture_id
+        "league": LEAGUES_DICT[league_name],
+        "season": get_season(league_name),
+        "next": count
     }
 
     try:
         # Make GET request to the API endpoint
-        response = requests.get(url, headers=FOOTBALL_API_HEADERS, params=params)
+        status, data = await api_get(endpoint, params, on_fetch=store_fixtures)
 
         # Check if request was successful (status code 200)
-        if response.status_code == 200:
-            # Parse JSON response
-            data = response.json()
-
-            # Extract predictions data
-            predictions_data = data['response'][0]
-
-            # Extract teams
-            home_team = predictions_data['teams']['home']['name']
-            away_team = predictions_data['teams']['away']['name']
-
-            # Extract comparison fields
-            comparison_fields = list(predictions_data['comparison'].keys())
-            comparison_fields.remove('poisson_distribution')
-            # Extract predictions, remove percent sign, and convert to decimal format
-            home_predictions = []
-            away_predictions = []
-            for field in comparison_fields:
-                home_pred_str = predictions_data['comparison'][field]['home']  # Get prediction as string
-                away_pred_str = predictions_data['comparison'][field]['away']  # Get prediction as string
-                home_pred = float(home_pred_str.rstrip('%')) / 100  # Remove percent sign and convert to decimal
-                away_pred = float(away_pred_str.rstrip('%')) / 100  # Remove percent sign and convert to decimal
-                home_predictions.append(home_pred)
-                away_predictions.append(away_pred)
-
-            # Create DataFrame
-            df = pd.DataFrame({
-                home_team: home_predictions,
-                away_team: away_predictions
-            }, index=comparison_fields)
-
-            return df
+        if status == 200:
+            return data['response']
 
         else:
-            print("Failed to retrieve predictions. Status code:", response.status_code)
+            print("Failed to retrieve next fixtures. Status code:", status)
             return None
 
     except Exception as e:
@@ -0,0 +1,140 @@
+import hashlib
+import os
+import struct
+
+from cache import TTLCache
+from config import IMAGE_CACHE_MAX_ENTRIES, IMAGE_CACHE_MAX_BYTES, IMAGE_CACHE_DIR, IMAGE_CACHE_DIR_MAX_BYTES
+
+IMAGE_CACHE = TTLCache(max_entries=IMAGE_CACHE_MAX_ENTRIES, max_bytes=IMAGE_CACHE_MAX_BYTES)
+
+# Bytes in IMAGE_CACHE_DIR as far as this process knows, other workers may be writing there too
+_disk_bytes = None
+
+# Files start with the length of the UTF-8 legend that follows, or NO_LEGEND for a bare image. Nothing in the
+# directory is ever unpickled, other processes write there too
+LEGEND_HEADER = struct.Struct('>i')
+NO_LEGEND = -1
+
+
+def _serialize(part):
+    # Records are tuples, so they hash by the repr of their values
+    if isinstance(part, (list, tuple)):
+        return b'(' + b','.join(_serialize(item) for item in part) + b')'
+    if isinstance(part, dict):
+        return _serialize(sorted(part.items()))
+    return repr(part).encode()
+
+
+def fingerprint(*parts):
+    hasher = hashlib.sha256()
+    for part in parts:
+        hasher.update(_serialize(part))
+        hasher.update(b'\0')
+    return hasher.hexdigest()
+
+
+def _image_size(image):
+    if isinstance(image, tuple):
+        return sum(len(part) for part in image)
+    return len(image)
+
+
+def _disk_path(key):
+    return os.path.join(IMAGE_CACHE_DIR, f'{key}.img')
+
+
+def _encode(image):
+    if isinstance(image, tuple):
+        image, legend = image
+        legend = legend.encode()
+        return LEGEND_HEADER.pack(len(legend)) + legend + image
+    return LEGEND_HEADER.pack(NO_LEGEND) + image
+
+
+def _decode(data):
+    (legend_size,) = LEGEND_HEADER.unpack_from(data)
+    offset = LEGEND_HEADER.size
+    if legend_size == NO_LEGEND:
+        return data[offset:]
+    if not 0 <= legend_size <= len(data) - offset:
+        raise ValueError("Corrupt cached image")
+    return data[offset + legend_size:], data[offset:offset + legend_size].decode()
+
+
+def get_image(key):
+    image = IMAGE_CACHE.get(key)
+    if image is not None or not IMAGE_CACHE_DIR:
+        return image
+
+    # Fall back to the images persisted by a previous run
+    path = _disk_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        f = open(path, 'rb')
+        image = _decode(f.read())
+        f.close()
+        # The modification time orders the files for pruning, so a read counts as a use
+        os.utime(path)
+    except Exception as e:
+        print("Failed to read cached image:", e)
+        return None
+
+    IMAGE_CACHE.set(key, image, size=_image_size(image))
+    return image
+
+
+def _scan_disk():
+    files = []
+    for entry in os.scandir(IMAGE_CACHE_DIR):
+        # Pickled images from older versions are never read, they go first as the oldest files
+        if entry.name.endswith(('.img', '.pickle')):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    return files
+
+
+def prune_disk(max_bytes=IMAGE_CACHE_DIR_MAX_BYTES):
+    global _disk_bytes
+
+    # Least recently used first, down to 90% of the cap so the next writes don't rescan the directory
+    files = sorted(_scan_disk())
+    total = sum(size for _, size, _ in files)
+    for _, size, path in files:
+        if total <= max_bytes * 0.9:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+    _disk_bytes = total
+
+
+def set_image(key, image):
+    global _disk_bytes
+
+    IMAGE_CACHE.set(key, image, size=_image_size(image))
+
+    if IMAGE_CACHE_DIR:
+        try:
+            os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+            if _disk_bytes is None:
+                _disk_bytes = sum(size for _, size, _ in _scan_disk())
+            tmp_path = _disk_path(key) + '.tmp'
+            f = open(tmp_path, 'wb')
+            f.write(_encode(image))
+            f.close()
+            _disk_bytes += os.path.getsize(tmp_path)
+            os.replace(tmp_path, _disk_path(key))
+            if _disk_bytes > IMAGE_CACHE_DIR_MAX_BYTES:
+                prune_disk()
+        except Exception as e:
+            print("Failed to persist cached image:", e)
+
+
+def get_image_cache_stats():
+    return IMAGE_CACHE.stats()
@@ -1,49 +1,65 @@
-import pandas as pd
+import io
+from collections import OrderedDict
+
 import matplotlib.pyplot as plt
-from matplotlib import cm
+from matplotlib import colormaps
 from matplotlib.colors import LinearSegmentedColormap
 from matplotlib.legend_handler import HandlerTuple
 from windrose import WindroseAxes
 import matplotlib.patches as mpatches
 import numpy as np
 
+from config import IMAGE_FORMAT, IMAGE_QUALITY, WIND_ROSE_TEMPLATES, WIND_ROSE_TEMPLATES_MAX
+from metrics import timed
+from records import Standing, FormResult, Player
+
+# Looked up once instead of on every wind rose
+HOME_COLOR = colormaps['cool'](0.7)
+AWAY_COLOR = colormaps['autumn'](0.7)
+
+
+@timed('encode')
+def save_figure(fig, image_format=IMAGE_FORMAT, quality=IMAGE_QUALITY, **kwargs):
+    # Encode straight into memory so concurrent renders never share a file on disk
+    buffer = io.BytesIO()
+    pil_kwargs = {'quality': quality} if image_format in ('jpeg', 'webp') else None
+    fig.savefig(buffer, format=image_format, pil_kwargs=pil_kwargs, **kwargs)
+    return buffer.getvalue()
 
-def make_standings_table_image(df, image_size=(10, 6)):
-    # Calculate column widths based on the length of team names
-    max_team_name_length = df['Team'].apply(len).max()
-    team_column_width = max_team_name_length * 0.15
 
-    points = df['Points'].astype(float)
-    norm = plt.Normalize(points.min(), points.max())
+def make_standings_table_image(standings, image_size=(10, 6), image_format=IMAGE_FORMAT, quality=IMAGE_QUALITY):
+    columns = Standing.COLUMNS
+
+    points = [float(row.points) for row in standings]
+    norm = plt.Normalize(min(points), max(points))
     cmap = LinearSegmentedColormap.from_list("RdYlGn_custom", ["red", "yellow", "green"])
     colors = cmap(norm(points))
-    cell_colors = [[tuple(color)] * len(df.columns) for color in colors]
 
     # Create the table plot
     fig, ax = plt.subplots(figsize=image_size)
     ax.axis('tight')
     ax.axis('off')
-    table = ax.table(cellText=df.values, colLabels=df.columns, loc='center', cellLoc='center')
-    for i in range(len(df)):
-        for j in range(len(df.columns)):
-            cell_color = colors[i]
-            table.get_celld()[(i+1, j)].set_facecolor(cell_color)
+    table = ax.table(cellText=standings, colLabels=columns, loc='center', cellLoc='center')
+    cells = table.get_celld()
+    for i in range(len(standings)):
+        cell_color = colors[i]
+        for j in range(len(columns)):
+            cells[(i+1, j)].set_facecolor(cell_color)
     table.auto_set_font_size(False)
     table.set_fontsize(12)
-    table.auto_set_column_width(col=list(range(len(df.columns))))
+    table.auto_set_column_width(col=list(range(len(columns))))
     table.scale(1, 1.5)
 
-    # Save the plot as a JPG image
-    file_path = "images/league_standings.jpg"
-    plt.savefig(file_path, bbox_inches='tight', pad_inches=0.1)
+    # Encode the plot as an image
+    image = save_figure(fig, image_format, quality, bbox_inches='tight', pad_inches=0.1)
 
     # Close the plot to free up resources
     plt.close(fig)
 
-    return file_path
+    return image
 
 
-def create_players_table(df):
+def create_players_table(players, image_format=IMAGE_FORMAT, quality=IMAGE_QUALITY):
     # Define colors for player positions
     position_colors = {
         'Goalkeeper': '#CD853F',  # Light brown
@@ -57,8 +73,8 @@ def create_players_table(df):
     ax.axis('off')  # Hide axes
 
     # Create the table plot
-    table = ax.table(cellText=df.values,
-                     colLabels=df.columns,
+    table = ax.table(cellText=players,
+                     colLabels=Player.COLUMNS,
                      cellLoc='center',
                      loc='center')
 
@@ -67,24 +83,23 @@ def create_players_table(df):
         if i == 0:
             cell.set_facecolor('lightgrey')  # Color header cells grey
         else:
-            if df.columns[j] == 'position':
+            if Player.COLUMNS[j] == 'position':
                 position = cell.get_text().get_text()
                 cell.set_facecolor(position_colors.get(position, 'white'))
 
     # Adjust layout
     plt.tight_layout()
 
-    # Save the plot as an image
-    file_path = 'images/team_players.jpg'
-    plt.savefig(file_path, bbox_inches='tight')
+    # Encode the plot as an image
+    image = save_figure(fig, image_format, quality, bbox_inches='tight')
 
     # Close the plot to free up resources
     plt.close(fig)
 
-    return file_path
+    return image
 
 
-def create_result_table(df):
+def create_result_table(results, image_format=IMAGE_FORMAT, quality=IMAGE_QUALITY):
     # Define colors for each result
     result_colors = {
         'W': '#90EE90',  # Light green for wins
@@ -97,8 +112,8 @@ def create_result_table(df):
     ax.axis('off')  # Hide axes
 
     # Create the table plot
-    table = ax.table(cellText=df.values,
-                     colLabels=df.columns,
+    table = ax.table(cellText=results,
+                     colLabels=FormResult.COLUMNS,
                      cellLoc='center',
                      loc='center')
 
@@ -107,61 +122,106 @@ def create_result_table(df):
         if i == 0:
             cell.set_facecolor('lightgrey')  # Color header row grey
         else:
-            result = df.iloc[i - 1]['W/D/L']
+            result = results[i - 1].outcome
             cell.set_facecolor(result_colors.get(result, 'white'))
 
     # Adjust layout
     plt.tight_layout()
 
-    # Save the plot as an image
-    file_path = 'images/team_result.jpg'
-    plt.savefig(file_path, bbox_inches='tight')
+    # Encode the plot as an image
+    image = save_figure(fig, image_format, quality, bbox_inches='tight')
 
     # Close the plot to free up resources
     plt.close(fig)
 
-    return file_path
+    return image
+
+
+def get_wind_rose_angles(num_directions):
+    # Direction angles in degrees, and in radians with the first one repeated to close the outline
+    degrees = list(range(0, 360, int(360 / num_directions)))[:num_directions]
+    radians = np.radians(degrees + [360])
+    return degrees, radians
 
-def create_wind_rose_by_predictions(df):
-    # Extract column names (directions)
-    directions = df.index.tolist()
-    num_directions = len(directions)
 
-    # Extract home and away team predictions
-    home_predictions = df[df.columns[0]].tolist()
-    away_predictions = df[df.columns[1]].tolist()
+def _closed(predictions):
+    return list(predictions) + [predictions[0]]
+
+
+def create_wind_rose_by_predictions(prediction, image_format=IMAGE_FORMAT, quality=IMAGE_QUALITY,
+                                    use_template=WIND_ROSE_TEMPLATES):
+    legend = f"{prediction.home_team} - blue\n{prediction.away_team} - orange"
+    if use_template:
+        return render_wind_rose_template(prediction, image_format, quality), legend
+
+    # Extract comparison fields (directions)
+    directions = list(prediction.fields)
+    degrees, angles = get_wind_rose_angles(len(directions))
+
+    # Extract home and away team predictions, closed back onto their first point
+    home_predictions = _closed(prediction.home)
+    away_predictions = _closed(prediction.away)
 
     # Create wind rose plot
     fig, ax = plt.subplots(subplot_kw={'projection': 'windrose'})
 
-    # Define colormaps
-    cmap_home = cm.get_cmap('cool')
-    cmap_away = cm.get_cmap('autumn')
-
     # Plot home team predictions
-    ax.plot(np.radians(range(0, 360, int(360 / num_directions))), home_predictions, color=cmap_home(0.7))
-    ax.fill(np.radians(range(0, 360, int(360 / num_directions))), home_predictions, color=cmap_home(0.7), alpha=0.3)
+    ax.plot(angles, home_predictions, color=HOME_COLOR)
+    ax.fill(angles, home_predictions, color=HOME_COLOR, alpha=0.3)
 
     # Plot away team predictions
-    ax.plot(np.radians(range(0, 360, int(360 / num_directions))), away_predictions, color=cmap_away(0.7))
-    ax.fill(np.radians(range(0, 360, int(360 / num_directions))), away_predictions, color=cmap_away(0.7), alpha=0.3)
+    ax.plot(angles, away_predictions, color=AWAY_COLOR)
+    ax.fill(angles, away_predictions, color=AWAY_COLOR, alpha=0.3)
 
     # Set direction labels on the edges
-    ax.set_thetagrids(range(0, 360, int(360 / num_directions)), directions)
+    ax.set_thetagrids(degrees, directions)
 
-    # Connect first and last dots
-    home_first_point = (np.radians(0), home_predictions[0])
-    home_last_point = (np.radians(360-int(360/num_directions)), home_predictions[-1])
-    ax.plot([home_first_point[0], home_last_point[0]], [home_first_point[1], home_last_point[1]], color=cmap_home(0.7))
+    # Encode the plot as an image
+    image = save_figure(fig, image_format, quality, bbox_inches='tight')
 
-    away_first_point = (np.radians(0), away_predictions[0])
-    away_last_point = (np.radians(360-int(360/num_directions)), away_predictions[-1])
-    ax.plot([away_first_point[0], away_last_point[0]], [away_first_point[1], away_last_point[1]], color=cmap_away(0.7))
+    plt.close(fig)
 
-    # Save the plot as an image
-    file_path = 'images/predictions.jpg'
-    plt.savefig(file_path, bbox_inches='tight')
+    return image, legend
 
-    plt.close(fig)
 
-    return file_path, f"{df.columns[0]} - blue\n{df.columns[1]} - orange"
+# Wind rose figures kept per comparison field set, only the two data series change between requests
+WIND_ROSE_TEMPLATES_CACHE = OrderedDict()
+
+
+def get_wind_rose_template(fields):
+    template = WIND_ROSE_TEMPLATES_CACHE.get(fields)
+    if template is not None:
+        WIND_ROSE_TEMPLATES_CACHE.move_to_end(fields)
+        return template
+
+    degrees, angles = get_wind_rose_angles(len(fields))
+    zeros = [0] * len(angles)
+
+    fig, ax = plt.subplots(subplot_kw={'projection': 'windrose'})
+    home_line, = ax.plot(angles, zeros, color=HOME_COLOR)
+    home_fill, = ax.fill(angles, zeros, color=HOME_COLOR, alpha=0.3)
+    away_line, = ax.plot(angles, zeros, color=AWAY_COLOR)
+    away_fill, = ax.fill(angles, zeros, color=AWAY_COLOR, alpha=0.3)
+    ax.set_thetagrids(degrees, list(fields))
+
+    template = (fig, ax, angles, home_line, home_fill, away_line, away_fill)
+    WIND_ROSE_TEMPLATES_CACHE[fields] = template
+    if len(WIND_ROSE_TEMPLATES_CACHE) > WIND_ROSE_TEMPLATES_MAX:
+        _, (old_fig, *_) = WIND_ROSE_TEMPLATES_CACHE.popitem(last=False)
+        plt.close(old_fig)
+    return template
+
+
+def render_wind_rose_template(prediction, image_format=IMAGE_FORMAT, quality=IMAGE_QUALITY):
+    fig, ax, angles, home_line, home_fill, away_line, away_fill = get_wind_rose_template(tuple(prediction.fields))
+
+    for line, fill, predictions in ((home_line, home_fill, prediction.home), (away_line, away_fill, prediction.away)):
+        values = _closed(predictions)
+        line.set_data(angles, values)
+        fill.set_xy(np.column_stack([angles, values]))
+
+    # Rescale the radial axis to the new data, like a freshly built figure would
+    ax.relim()
+    ax.autoscale_view()
+
+    return save_figure(fig, image_format, quality, bbox_inches='tight')
@@ -0,0 +1,202 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+from config import LIVE_POLL_INTERVAL, LIVE_SEND_CONCURRENCY
+from football_api_getters import get_live_fixtures_by_leagues, get_fixtures_by_ids
+from prewarm import get_popular_league_ids, on_fixture_finished
+from rate_limiter import BACKGROUND
+from storage import save_subscription, delete_subscriptions, delete_target_subscriptions, load_subscriptions, \
+    load_fixture, save_in_background
+from string_transformers import create_match_update_string
+
+# league id -> chat ids, fixture id -> chat ids
+LEAGUE_SUBSCRIBERS = defaultdict(set)
+FIXTURE_SUBSCRIBERS = defaultdict(set)
+FIXTURE_LEAGUES = {}
+
+# Statuses after which a match won't be live again
+FINAL_STATUSES = {'FT', 'AET', 'PEN', 'PST', 'CANC', 'ABD', 'AWD', 'WO'}
+
+# fixture id -> (fixture payload, (home goals, away goals, status)) from the previous poll
+_snapshot = {}
+
+
+def load_saved_subscriptions():
+    # The store is the one list every bot worker writes to, the poller rereads it instead of trusting its own memory
+    league_subscribers = defaultdict(set)
+    fixture_subscribers = defaultdict(set)
+    fixture_leagues = {}
+    for chat_id, kind, target_id in load_subscriptions():
+        if kind == 'league':
+            league_subscribers[target_id].add(chat_id)
+            continue
+
+        league_id = FIXTURE_LEAGUES.get(target_id)
+        if league_id is None:
+            fixture = load_fixture(target_id)
+            if fixture is None or not fixture.get('league'):
+                continue
+            league_id = fixture['league']['id']
+        fixture_subscribers[target_id].add(chat_id)
+        fixture_leagues[target_id] = league_id
+
+    for subscribers, loaded in ((LEAGUE_SUBSCRIBERS, league_subscribers), (FIXTURE_SUBSCRIBERS, fixture_subscribers),
+                                (FIXTURE_LEAGUES, fixture_leagues)):
+        subscribers.clear()
+        subscribers.update(loaded)
+
+
+def follow_league(chat_id, league_id):
+    LEAGUE_SUBSCRIBERS[league_id].add(chat_id)
+    save_in_background(save_subscription, chat_id, 'league', league_id)
+
+
+def follow_fixture(chat_id, fixture_id):
+    # The poller works per league, so only fixtures we've already seen (and know the league of) can be followed
+    fixture = load_fixture(fixture_id)
+    if fixture is None or not fixture.get('league'):
+        return False
+
+    FIXTURE_SUBSCRIBERS[fixture_id].add(chat_id)
+    FIXTURE_LEAGUES[fixture_id] = fixture['league']['id']
+    save_in_background(save_subscription, chat_id, 'fixture', fixture_id)
+    return True
+
+
+def unfollow_all(chat_id):
+    for subscribers in (LEAGUE_SUBSCRIBERS, FIXTURE_SUBSCRIBERS):
+        for target_id in list(subscribers):
+            subscribers[target_id].discard(chat_id)
+            if not subscribers[target_id]:
+                del subscribers[target_id]
+                FIXTURE_LEAGUES.pop(target_id, None)
+    save_in_background(delete_subscriptions, chat_id)
+
+
+def get_polled_leagues():
+    league_ids = set(LEAGUE_SUBSCRIBERS)
+    league_ids.update(FIXTURE_LEAGUES[fixture_id] for fixture_id in FIXTURE_SUBSCRIBERS)
+    return sorted(league_ids)
+
+
+def get_fixture_state(fixture):
+    return fixture['goals']['home'] or 0, fixture['goals']['away'] or 0, fixture['fixture']['status']['short']
+
+
+def diff_fixtures(fixtures, league_ids):
+    """Changes since the previous poll, and the ids of the fixtures that dropped out of the live list."""
+    changes = []
+    live_ids = set()
+
+    for fixture in fixtures:
+        fixture_id = fixture['fixture']['id']
+        live_ids.add(fixture_id)
+        state = get_fixture_state(fixture)
+        previous = _snapshot.get(fixture_id)
+        _snapshot[fixture_id] = (fixture, state)
+
+        if previous is None:
+            continue
+        previous_state = previous[1]
+        if state[:2] != previous_state[:2]:
+            changes.append((fixture, 'goal'))
+        elif state[2] != previous_state[2]:
+            changes.append((fixture, 'finished' if state[2] in FINAL_STATUSES else 'status'))
+
+    # A fixture also drops out when its league is no longer polled, when it was already reported as finished
+    # or when the upstream leaves it out for a poll, so the rest still has to be confirmed
+    missing = []
+    for fixture_id in list(_snapshot):
+        if fixture_id in live_ids:
+            continue
+        fixture, state = _snapshot[fixture_id]
+        if fixture['league']['id'] not in league_ids or state[2] in FINAL_STATUSES:
+            del _snapshot[fixture_id]
+        else:
+            missing.append(fixture_id)
+
+    return changes, missing
+
+
+async def confirm_finished(fixture_ids):
+    # Always asked upstream, a cached answer could be older than the live list it contradicts
+    fixtures = await get_fixtures_by_ids(fixture_ids, priority=BACKGROUND, refresh=True)
+    if fixtures is None:
+        # Kept in the snapshot and checked again after the next poll
+        return []
+
+    changes = []
+    found = set()
+    for fixture in fixtures:
+        fixture_id = fixture['fixture']['id']
+        found.add(fixture_id)
+        if fixture['fixture']['status']['short'] in FINAL_STATUSES:
+            _snapshot.pop(fixture_id, None)
+            changes.append((fixture, 'finished'))
+
+    # Fixtures the upstream no longer knows can't be followed anymore
+    for fixture_id in set(fixture_ids) - found:
+        _snapshot.pop(fixture_id, None)
+    return changes
+
+
+async def push_changes(bot, changes):
+    semaphore = asyncio.Semaphore(LIVE_SEND_CONCURRENCY)
+
+    async def send(chat_id, text):
+        async with semaphore:
+            try:
+                await bot.send_message(chat_id, text)
+            except Exception as e:
+                logging.warning("Failed to push live update to %s: %s", chat_id, e)
+
+    sends = []
+    for fixture, change in changes:
+        chat_ids = LEAGUE_SUBSCRIBERS.get(fixture['league']['id'], set()) | \
+            FIXTURE_SUBSCRIBERS.get(fixture['fixture']['id'], set())
+        text = create_match_update_string(fixture, change)
+        sends.extend(send(chat_id, text) for chat_id in chat_ids)
+
+        if change == 'finished' and fixture['fixture']['id'] in FIXTURE_SUBSCRIBERS:
+            del FIXTURE_SUBSCRIBERS[fixture['fixture']['id']]
+            FIXTURE_LEAGUES.pop(fixture['fixture']['id'], None)
+            save_in_background(delete_target_subscriptions, 'fixture', fixture['fixture']['id'])
+    await asyncio.gather(*sends)
+
+
+async def poll_once(bot):
+    # Chats may have followed or unfollowed through any bot worker since the last poll
+    load_saved_subscriptions()
+    league_ids = get_polled_leagues()
+    if not league_ids:
+        _snapshot.clear()
+        return
+
+    # One upstream call covers every subscribed league, however many users follow them. The most requested
+    # leagues ride along for free, so the pre-warmer hears when their matches finish
+    league_ids = sorted(set(league_ids) | set(get_popular_league_ids()))
+    fixtures_by_league = await get_live_fixtures_by_leagues(league_ids, priority=BACKGROUND)
+    if fixtures_by_league is None:
+        return
+
+    changes, missing = diff_fixtures([fixture for fixtures in fixtures_by_league.values() for fixture in fixtures],
+                                     league_ids)
+    if missing:
+        changes.extend(await confirm_finished(missing))
+    for fixture, change in changes:
+        if change == 'finished':
+            on_fixture_finished(fixture)
+    if changes:
+        await push_changes(bot, changes)
+
+
+async def run_live_poller(bot):
+    while True:
+        try:
+            await poll_once(bot)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.exception("Live poller failed: %s", e)
+        await asyncio.sleep(LIVE_POLL_INTERVAL)
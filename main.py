@@ -1,11 +1,27 @@
+import asyncio
 import logging
+import time
+
+STARTED_AT = time.perf_counter()
+
 from aiogram import Bot, Dispatcher, types, executor
+from aiogram.bot.api import TelegramAPIServer, TELEGRAM_PRODUCTION
 
-from config import TELE_TOKEN
+from config import TELE_TOKEN, TELEGRAM_API_URL, IMAGE_FORMAT, FAST_START, BOT_MODE, LIVE_POLLER_ENABLED, \
+    METRICS_PORT, PREWARM_ENABLED, CATALOG_LEAGUES, PREDICTION_BATCH_MAX
+from api_client import close_session
+from catalog import run_catalog_sync
 from football_api_getters import get_league_table, LEAGUES_DICT, get_current_matches_by_league, \
-    get_prediction_by_fixture_id, get_team_players, get_team_form, update_team_dict, get_team_dict
-from image_makers import make_standings_table_image, create_wind_rose_by_predictions, create_players_table, \
-    create_result_table
+    get_predictions_by_fixture_ids, get_next_fixtures, get_team_players, get_team_form, update_team_dict, \
+    get_team_dict, load_league_dict, find_leagues, find_teams
+from render_pool import render, RenderQueueFull, shutdown as shutdown_render_pool, warm_up as warm_up_render_pool
+from live_updates import follow_league, follow_fixture, unfollow_all, run_live_poller
+from metrics import span
+from monitoring import HandlerMetrics, start_metrics_server
+from prewarm import record_league, record_team, run_prewarmer
+from sessions import SESSIONS
+from storage import close as close_store, wait_for_writes
+from telegram_files import answer_photo, answer_photo_group
 from string_transformers import create_current_matches_string
 
 league_keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)
@@ -13,18 +29,30 @@ league_keyboard.add(types.KeyboardButton(text="Table"))
 league_keyboard.add(types.KeyboardButton(text="Team"))
 league_keyboard.add(types.KeyboardButton(text="Matches on-air"))
 league_keyboard.add(types.KeyboardButton(text="Match comparison"))
+league_keyboard.add(types.KeyboardButton(text="Matchday comparison"))
+league_keyboard.add(types.KeyboardButton(text="Follow live"))
 
 team_keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)
 team_keyboard.add(types.KeyboardButton(text="Players"))
 team_keyboard.add(types.KeyboardButton(text="Last 10 matches"))
 
-CURRENT_LEAGUE = ''
-CURRENT_TEAM = ''
-
 
 logging.basicConfig(level=logging.INFO)
-bot = Bot(token=TELE_TOKEN)
+bot = Bot(token=TELE_TOKEN,
+          server=TelegramAPIServer.from_base(TELEGRAM_API_URL) if TELEGRAM_API_URL else TELEGRAM_PRODUCTION)
 dp = Dispatcher(bot)
+dp.middleware.setup(HandlerMetrics())
+
+
+IMAGE_EXTENSION = 'jpg' if IMAGE_FORMAT == 'jpeg' else IMAGE_FORMAT
+
+
+async def answer_image(message: types.Message, image, name):
+    await answer_photo(message, image, f'{name}.{IMAGE_EXTENSION}')
+
+
+async def reply_unavailable(message: types.Message):
+    await message.reply("Football data is unavailable right now, please try again later")
 
 
 @dp.message_handler(commands=['start'])
@@ -32,91 +60,248 @@ async def send_welcome(message: types.Message):
     await message.reply("Welcome to the Analytics Football Bot! Please specify league that you want to discover:", reply_markup=types.ReplyKeyboardRemove())
 
 
+async def get_league_session(message: types.Message):
+    # Sessions expire and don't survive a restart, while the keyboard stays on the user's screen
+    session = SESSIONS.get(message.chat.id)
+    if session.league not in LEAGUES_DICT:
+        await send_welcome(message)
+        return None
+    return session
+
+
+async def get_team_session(message: types.Message):
+    session = await get_league_session(message)
+    if session is not None and session.team not in get_team_dict(session.league):
+        await send_welcome(message)
+        return None
+    return session
+
+
 @dp.message_handler(lambda message: message.text in LEAGUES_DICT)
 async def handle_league_choice(message: types.Message):
-    global CURRENT_LEAGUE
+    session = SESSIONS.get(message.chat.id)
 
-    if CURRENT_LEAGUE != message.text:
-        CURRENT_LEAGUE = message.text
-        update_team_dict(CURRENT_LEAGUE)
+    session.league = message.text
+    with span('fetch'):
+        await update_team_dict(session.league)
     await message.reply("What do you want to know?", reply_markup=league_keyboard)
 
 
 @dp.message_handler(lambda message: message.text == "Table")
 async def handle_league_table(message: types.Message):
-    df = get_league_table(CURRENT_LEAGUE)
-    image_path = make_standings_table_image(df)
-
-    with open(image_path, 'rb') as photo:
-        await message.answer_photo(photo)
-
-    message.text = CURRENT_LEAGUE
+    session = await get_league_session(message)
+    if session is None:
+        return
+    record_league(session.league)
+    with span('fetch'):
+        standings = await get_league_table(session.league)
+    if standings:
+        image = await render('make_standings_table_image', standings)
+        await answer_image(message, image, 'league_standings')
+    else:
+        await reply_unavailable(message)
+
+    message.text = session.league
     await handle_league_choice(message)
 
 
 @dp.message_handler(lambda message: message.text == "Team")
 async def handle_team_input(message: types.Message):
-    await message.reply(f"What team of the league {CURRENT_LEAGUE} do you want to discover?", reply_markup=types.ReplyKeyboardRemove())
+    session = await get_league_session(message)
+    if session is None:
+        return
+    await message.reply(f"What team of the league {session.league} do you want to discover?", reply_markup=types.ReplyKeyboardRemove())
 
 
 @dp.message_handler(lambda message: message.text == "Matches on-air")
 async def handle_league_matches(message: types.Message):
-    df = get_current_matches_by_league(CURRENT_LEAGUE)
-    curr_matches = create_current_matches_string(df)
-
-    await message.reply(curr_matches)
-    message.text = CURRENT_LEAGUE
+    session = await get_league_session(message)
+    if session is None:
+        return
+    with span('fetch'):
+        matches = await get_current_matches_by_league(session.league)
+    if matches is None:
+        await reply_unavailable(message)
+    elif not matches:
+        await message.reply("There are no matches on-air right now")
+    else:
+        await message.reply(create_current_matches_string(matches))
+    message.text = session.league
     await handle_league_choice(message)
 
 
+# Largest id SQLite can store as an INTEGER
+MAX_FIXTURE_ID = 2 ** 63 - 1
+
+
+def is_fixture_id(text):
+    # isnumeric() also accepts characters like "²" that int() can't parse
+    return text.isdecimal() and len(text) <= len(str(MAX_FIXTURE_ID)) and 0 < int(text) <= MAX_FIXTURE_ID
+
+
 @dp.message_handler(lambda message: message.text == "Match comparison")
 async def handle_match_comparison_input(message: types.Message):
     await message.reply(f"Please, enter match id:", reply_markup=types.ReplyKeyboardRemove())
 
 
+async def compare_fixtures(message: types.Message, fixture_ids, fixtures=None):
+    with span('fetch'):
+        predictions = await get_predictions_by_fixture_ids(fixture_ids, fixtures)
+    found = [(fixture_id, prediction) for fixture_id, prediction in zip(fixture_ids, predictions)
+             if prediction is not None]
+    if not found:
+        await reply_unavailable(message)
+        return
+
+    rendered = await asyncio.gather(*(render('create_wind_rose_by_predictions', prediction)
+                                      for _, prediction in found))
+    if len(rendered) == 1:
+        image, legend = rendered[0]
+        await answer_image(message, image, 'predictions')
+        await message.reply(legend)
+        return
+
+    # Several fixtures go out as one album instead of a photo and a legend each
+    await answer_photo_group(message, [
+        (image, f'predictions_{fixture_id}.{IMAGE_EXTENSION}', f"Match {fixture_id}\n{legend}")
+        for (fixture_id, _), (image, legend) in zip(found, rendered)
+    ])
+
+
 @dp.message_handler(lambda message: message.text.isnumeric())
 async def handle_match_comparison(message: types.Message):
-    df = get_prediction_by_fixture_id(message.text)
-    image_path, legend = create_wind_rose_by_predictions(df)
+    if not is_fixture_id(message.text):
+        await message.reply("Please, enter match id:")
+        return
+    session = SESSIONS.get(message.chat.id)
+    await compare_fixtures(message, [message.text])
+
+    # A match id works without a league, the league menu only comes back if one is still chosen
+    if session.league in LEAGUES_DICT:
+        message.text = session.league
+        await handle_league_choice(message)
+
+
+@dp.message_handler(commands=['compare'])
+async def handle_batch_comparison(message: types.Message):
+    fixture_ids = [part for part in message.get_args().replace(',', ' ').split() if is_fixture_id(part)]
+    if not fixture_ids:
+        await message.reply("Please, enter the ids of the matches to compare: /compare <match id> <match id> ...")
+        return
+    await compare_fixtures(message, list(dict.fromkeys(fixture_ids))[:PREDICTION_BATCH_MAX])
+
+
+@dp.message_handler(lambda message: message.text == "Matchday comparison")
+async def handle_matchday_comparison(message: types.Message):
+    session = await get_league_session(message)
+    if session is None:
+        return
+    with span('fetch'):
+        fixtures = await get_next_fixtures(session.league, PREDICTION_BATCH_MAX)
+    if fixtures is None:
+        await reply_unavailable(message)
+    elif not fixtures:
+        await message.reply("There are no upcoming matches right now")
+    else:
+        # The listed fixtures already carry their kickoff times
+        await compare_fixtures(message, [str(fixture['fixture']['id']) for fixture in fixtures],
+                               {fixture['fixture']['id']: fixture for fixture in fixtures})
+
+    message.text = session.league
+    await handle_league_choice(message)
 
-    with open(image_path, 'rb') as photo:
-        await message.answer_photo(photo)
-    await message.reply(legend)
 
-    message.text = CURRENT_LEAGUE
+@dp.message_handler(lambda message: message.text == "Follow live")
+async def handle_follow_league(message: types.Message):
+    session = await get_league_session(message)
+    if session is None:
+        return
+    follow_league(message.chat.id, LEAGUES_DICT[session.league])
+
+    await message.reply(f"You will get goals and status changes of {session.league} live matches. "
+                        f"Use /follow <match id> to follow a single match and /unfollow to stop.")
+    message.text = session.league
     await handle_league_choice(message)
 
 
-@dp.message_handler(lambda message: message.text in get_team_dict())
-async def handle_team_choice(message: types.Message):
-    global CURRENT_TEAM
+@dp.message_handler(commands=['follow'])
+async def handle_follow_fixture(message: types.Message):
+    fixture_id = message.get_args()
+    if not is_fixture_id(fixture_id) or not follow_fixture(message.chat.id, int(fixture_id)):
+        await message.reply("Please, enter the id of a match from \"Matches on-air\": /follow <match id>")
+        return
+    await message.reply(f"You will get updates of match {fixture_id}")
+
 
-    CURRENT_TEAM = message.text
+@dp.message_handler(commands=['unfollow'])
+async def handle_unfollow(message: types.Message):
+    unfollow_all(message.chat.id)
+    await message.reply("You won't get live updates anymore")
+
+
+@dp.message_handler(lambda message: message.text in get_team_dict(SESSIONS.get(message.chat.id).league))
+async def handle_team_choice(message: types.Message):
+    SESSIONS.get(message.chat.id).team = message.text
     await message.reply("What do you want to know about team?", reply_markup=team_keyboard)
 
 
 @dp.message_handler(lambda message: message.text == 'Players')
 async def handle_team_players(message: types.Message):
-    df = get_team_players(CURRENT_TEAM)
-    image_path = create_players_table(df)
-
-    with open(image_path, 'rb') as photo:
-        await message.answer_photo(photo)
-
-    message.text = CURRENT_TEAM
+    session = await get_team_session(message)
+    if session is None:
+        return
+    with span('fetch'):
+        players = await get_team_players(session.league, session.team)
+    if players:
+        image = await render('create_players_table', players)
+        await answer_image(message, image, 'team_players')
+    else:
+        await reply_unavailable(message)
+
+    message.text = session.team
     await handle_team_choice(message)
 
 
 @dp.message_handler(lambda message: message.text == 'Last 10 matches')
 async def handle_team_last_matches(message: types.Message):
-    df = get_team_form(CURRENT_TEAM)
-    image_path = create_result_table(df)
+    session = await get_team_session(message)
+    if session is None:
+        return
+    record_team(session.league, session.team)
+    with span('fetch'):
+        results = await get_team_form(session.league, session.team)
+    if results:
+        image = await render('create_result_table', results)
+        await answer_image(message, image, 'team_result')
+    else:
+        await reply_unavailable(message)
+
+    message.text = session.team
+    await handle_team_choice(message)
 
-    with open(image_path, 'rb') as photo:
-        await message.answer_photo(photo)
 
-    message.text = CURRENT_TEAM
-    await handle_team_choice(message)
+def find_names(message: types.Message):
+    # Teams of the chosen league are tried first, then the whole league catalog
+    teams = find_teams(SESSIONS.get(message.chat.id).league, message.text)
+    if teams:
+        return {'names': teams, 'choose': handle_team_choice}
+    leagues = find_leagues(message.text)
+    if leagues:
+        return {'names': leagues, 'choose': handle_league_choice}
+    return False
+
+
+@dp.message_handler(find_names)
+async def handle_name_search(message: types.Message, names, choose):
+    if len(names) == 1:
+        message.text = names[0]
+        await choose(message)
+        return
+
+    names_keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    for name in names:
+        names_keyboard.add(types.KeyboardButton(text=name))
+    await message.reply("Which one do you mean?", reply_markup=names_keyboard)
 
 
 @dp.message_handler()
@@ -125,5 +310,55 @@ async def handle_choice(message: types.Message):
     await send_welcome(message)
 
 
+@dp.errors_handler(exception=RenderQueueFull)
+async def handle_render_queue_full(update: types.Update, exception: RenderQueueFull):
+    logging.warning(exception)
+    if update.message:
+        await update.message.reply('The bot is busy right now, please try again in a moment')
+    return True
+
+
+async def warm_up():
+    await asyncio.gather(load_league_dict(), warm_up_render_pool())
+    logging.info("Bot ready after %.2fs (%d leagues loaded)", time.perf_counter() - STARTED_AT, len(LEAGUES_DICT))
+
+
+async def on_startup(dp: Dispatcher):
+    logging.info("Dispatcher live after %.2fs", time.perf_counter() - STARTED_AT)
+
+    # In fast-start mode polling begins right away and the heavy loading happens in the background
+    if FAST_START:
+        dp['warm_up_task'] = asyncio.create_task(warm_up())
+    else:
+        await warm_up()
+
+    if METRICS_PORT:
+        dp['metrics_runner'] = await start_metrics_server()
+
+    # With several bot workers only one of them polls live matches and pre-warms the caches
+    if LIVE_POLLER_ENABLED:
+        dp['live_poller_task'] = asyncio.create_task(run_live_poller(dp.bot))
+    if PREWARM_ENABLED:
+        dp['prewarmer_task'] = asyncio.create_task(run_prewarmer())
+    if CATALOG_LEAGUES:
+        dp['catalog_task'] = asyncio.create_task(run_catalog_sync())
+
+
+async def on_shutdown(dp: Dispatcher):
+    for task in ('live_poller_task', 'prewarmer_task', 'catalog_task'):
+        if task in dp.data:
+            dp[task].cancel()
+    if 'metrics_runner' in dp.data:
+        await dp['metrics_runner'].cleanup()
+    await close_session()
+    shutdown_render_pool()
+    await wait_for_writes()
+    close_store()
+
+
 if __name__ == '__main__':
-    executor.start_polling(dp, skip_updates=True)
+    if BOT_MODE == 'webhook':
+        from webhook import start_webhook
+        start_webhook(dp, on_startup=on_startup, on_shutdown=on_shutdown)
+    else:
+        executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
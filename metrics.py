@@ -0,0 +1,160 @@
+import asyncio
+import functools
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Seconds, from a cache hit to a slow matplotlib figure or upload
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Handler the current update is being processed by, added to every span recorded on its behalf
+_handler = ContextVar('metrics_handler', default='')
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+HISTOGRAMS = defaultdict(dict)
+COUNTERS = defaultdict(lambda: defaultdict(float))
+COLLECTORS = []
+
+# In render workers observations are kept here and shipped back to the bot process with the result
+_forwarded = None
+
+
+def _labels_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def observe(name, value, **labels):
+    if _forwarded is not None:
+        _forwarded.append((name, labels, value))
+        return
+
+    key = _labels_key(labels)
+    histogram = HISTOGRAMS[name].get(key)
+    if histogram is None:
+        histogram = HISTOGRAMS[name][key] = Histogram()
+    histogram.observe(value)
+
+
+def inc(name, value=1, **labels):
+    COUNTERS[name][_labels_key(labels)] += value
+
+
+def set_handler(name):
+    return _handler.set(name)
+
+
+def reset_handler(token):
+    _handler.reset(token)
+
+
+@contextmanager
+def span(stage, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('bot_stage_seconds', time.perf_counter() - started, stage=stage, handler=_handler.get(), **labels)
+
+
+def timed(stage):
+    """Records every call of the decorated function, sync or async, as a `stage` span."""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def forward_observations():
+    global _forwarded
+    _forwarded = []
+
+
+def drain_observations():
+    observations = list(_forwarded or ())
+    if _forwarded:
+        _forwarded.clear()
+    return observations
+
+
+def record_observations(observations):
+    # Spans from a render worker belong to the handler that asked for the image
+    for name, labels, value in observations:
+        observe(name, value, **{**labels, 'handler': _handler.get()})
+
+
+def register_collector(collector):
+    """`collector()` returns (name, labels, value) gauges read at scrape time."""
+    COLLECTORS.append(collector)
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for name, histograms in sorted(HISTOGRAMS.items()):
+        lines.append(f'# TYPE {name} histogram')
+        for key, histogram in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(key, [("le", str(bound))])} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(key, [("le", "+Inf")])} {histogram.count}')
+            lines.append(f'{name}_sum{_format_labels(key)} {_format_value(histogram.sum)}')
+            lines.append(f'{name}_count{_format_labels(key)} {histogram.count}')
+
+    for name, counters in sorted(COUNTERS.items()):
+        lines.append(f'# TYPE {name} counter')
+        for key, value in sorted(counters.items()):
+            lines.append(f'{name}{_format_labels(key)} {_format_value(value)}')
+
+    gauges = defaultdict(list)
+    for collector in COLLECTORS:
+        for name, labels, value in collector():
+            if value is not None:
+                gauges[name].append((_labels_key(labels), value))
+    for name, values in sorted(gauges.items()):
+        lines.append(f'# TYPE {name} gauge')
+        for key, value in values:
+            lines.append(f'{name}{_format_labels(key)} {_format_value(value)}')
+
+    return '\n'.join(lines) + '\n'
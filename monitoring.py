@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import threading
+import time
+
+from aiohttp import web
+from aiogram import types
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from api_client import get_cache_stats, get_quota_stats, get_breaker_stats
+from config import METRICS_HOST, METRICS_PORT, PROFILER_ENABLED, PROFILER_INTERVAL
+from image_cache import get_image_cache_stats
+from metrics import observe, set_handler, reset_handler, register_collector, render_metrics
+from profiler import SamplingProfiler
+from render_pool import get_render_stats
+from sessions import SESSIONS
+from telegram_files import get_file_id_stats
+
+BREAKER_STATES = {'closed': 0, 'half-open': 1, 'open': 2}
+
+
+class HandlerMetrics(BaseMiddleware):
+    """Times every message handler and tags the spans recorded while it runs with its name."""
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        name = current_handler.get().__name__
+        data['metrics_handler'] = (name, set_handler(name), time.perf_counter())
+
+    async def on_post_process_message(self, message: types.Message, results, data: dict):
+        if 'metrics_handler' in data:
+            name, token, started = data.pop('metrics_handler')
+            observe('bot_handler_seconds', time.perf_counter() - started, handler=name)
+            reset_handler(token)
+
+
+def _cache_gauges(cache, stats):
+    for field in ('entries', 'bytes', 'hits', 'stale_hits', 'misses', 'hit_ratio'):
+        yield f'bot_cache_{field}', {'cache': cache}, stats.get(field)
+
+
+def collect_stats():
+    api_cache = get_cache_stats()
+    yield from _cache_gauges('football_api', api_cache)
+    yield 'football_api_coalesced_requests', {}, api_cache['coalesced']
+    yield from _cache_gauges('image', get_image_cache_stats())
+    yield from _cache_gauges('telegram_file_id', get_file_id_stats())
+
+    quota = get_quota_stats()
+    yield 'football_api_quota_daily_limit', {}, quota['daily_limit']
+    yield 'football_api_quota_daily_remaining', {}, quota['daily_remaining']
+    yield 'football_api_quota_daily_reset_seconds', {}, quota['daily_reset_in']
+    yield 'football_api_quota_minute_remaining', {}, quota['minute_remaining']
+    for priority, count in quota['throttled'].items():
+        yield 'football_api_quota_throttled', {'priority': priority}, count
+    for priority, count in quota['rejected'].items():
+        yield 'football_api_quota_rejected', {'priority': priority}, count
+
+    breaker = get_breaker_stats()
+    yield 'football_api_breaker_state', {}, BREAKER_STATES[breaker['state']]
+    yield 'football_api_breaker_trips', {}, breaker['trips']
+
+    for field, value in get_render_stats().items():
+        yield f'bot_render_{field}', {}, value
+    yield 'bot_sessions', {}, len(SESSIONS)
+
+
+register_collector(collect_stats)
+
+
+async def handle_metrics(request: web.Request):
+    return web.Response(body=render_metrics().encode(),
+                        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+async def handle_profile(request: web.Request):
+    try:
+        seconds = min(float(request.query.get('seconds', 10)), 300)
+    except ValueError:
+        return web.Response(status=400, text="seconds must be a number")
+
+    # The event loop thread is the one doing the bot's work
+    profiler = SamplingProfiler(PROFILER_INTERVAL, threading.get_ident())
+    profiler.start()
+    await asyncio.sleep(seconds)
+    profiler.stop()
+    logging.info("Profiled %.0fs, %d samples", seconds, profiler.samples)
+    return web.Response(text=profiler.collapsed(), content_type='text/plain')
+
+
+def make_app():
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    if PROFILER_ENABLED:
+        app.router.add_get('/debug/profile', handle_profile)
+    return app
+
+
+async def start_metrics_server(port=METRICS_PORT):
+    runner = web.AppRunner(make_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, port).start()
+    logging.info("Metrics on http://%s:%d/metrics", METRICS_HOST, port)
+    return runner
@@ -0,0 +1,120 @@
+import bisect
+import difflib
+import re
+import unicodedata
+from collections import defaultdict
+
+YEAR_PATTERN = re.compile(r'\b(19|20)\d{2}\b')
+
+
+def normalize_name(text):
+    # Case, diacritics and punctuation shouldn't decide whether a name matches
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    text = re.sub(r'[^\w]+', ' ', text.casefold())
+    return ' '.join(text.split())
+
+
+def _trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameEntry:
+    __slots__ = ('key', 'id', 'country', 'seasons')
+
+    def __init__(self, key, id, country=None, seasons=()):
+        self.key = key
+        self.id = id
+        self.country = country
+        self.seasons = frozenset(seasons)
+
+
+class NameIndex:
+    """Normalized name lookup with exact, country/season-qualified, prefix and fuzzy matching."""
+
+    def __init__(self, max_results=10, fuzzy_cutoff=0.75):
+        self.max_results = max_results
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self._by_name = defaultdict(list)
+        self._sorted_names = []
+        self._by_trigram = defaultdict(set)
+        self._countries = set()
+
+    def add(self, name, key, id, country=None, seasons=()):
+        entry = NameEntry(key, id, country, seasons)
+        for alias in {name, key}:
+            normalized = normalize_name(alias)
+            if normalized not in self._by_name:
+                bisect.insort(self._sorted_names, normalized)
+                for trigram in _trigrams(normalized):
+                    self._by_trigram[trigram].add(normalized)
+            # Adding a key again replaces its entry
+            entries = self._by_name[normalized]
+            entries[:] = [existing for existing in entries if existing.key != key]
+            entries.append(entry)
+        if country:
+            self._countries.add(normalize_name(country))
+
+    def find(self, text):
+        if not text:
+            return []
+
+        normalized = normalize_name(text)
+
+        # A four digit year in the query selects leagues that have that season
+        season = None
+        year = YEAR_PATTERN.search(normalized)
+        if year:
+            season = int(year.group(0))
+            normalized = ' '.join(YEAR_PATTERN.sub(' ', normalized).split())
+
+        entries = self._find_exact(normalized) or self._find_prefix(normalized) or self._find_fuzzy(normalized)
+        if season is not None:
+            entries = [entry for entry in entries if season in entry.seasons] or entries
+        return [entry.key for entry in entries[:self.max_results]]
+
+    def _find_exact(self, normalized):
+        entries = self._by_name.get(normalized)
+        if entries:
+            return list(entries)
+
+        # "Premier League England" or "England Premier League": split off a known country
+        tokens = normalized.split()
+        for i in range(1, len(tokens)):
+            for name, country in ((tokens[:i], tokens[i:]), (tokens[i:], tokens[:i])):
+                country = ' '.join(country)
+                if country not in self._countries:
+                    continue
+                entries = [entry for entry in self._by_name.get(' '.join(name), ())
+                           if entry.country and normalize_name(entry.country) == country]
+                if entries:
+                    return entries
+        return []
+
+    def _find_prefix(self, normalized):
+        entries = []
+        position = bisect.bisect_left(self._sorted_names, normalized)
+        while position < len(self._sorted_names) and len(entries) < self.max_results:
+            name = self._sorted_names[position]
+            if not name.startswith(normalized):
+                break
+            entries.extend(entry for entry in self._by_name[name] if entry not in entries)
+            position += 1
+        return entries
+
+    def _find_fuzzy(self, normalized):
+        # Only names sharing trigrams with the query are scored, not the whole catalog
+        counts = defaultdict(int)
+        for trigram in _trigrams(normalized):
+            for name in self._by_trigram.get(trigram, ()):
+                counts[name] += 1
+        candidates = sorted(counts, key=counts.get, reverse=True)[:50]
+
+        entries = []
+        for name in difflib.get_close_matches(normalized, candidates, n=self.max_results, cutoff=self.fuzzy_cutoff):
+            entries.extend(entry for entry in self._by_name[name] if entry not in entries)
+        return entries
+
+    def __len__(self):
+        return len(self._by_name)
@@ -0,0 +1,133 @@
+import io
+import logging
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
+
+from config import IMAGE_FORMAT, IMAGE_QUALITY, PIL_FONT_PATH
+from metrics import timed
+from records import Standing, FormResult, Player
+
+# Same palette as the matplotlib tables
+WHITE = (255, 255, 255)
+LIGHT_GREY = (211, 211, 211)
+GRID = (0, 0, 0)
+TEXT = (0, 0, 0)
+
+POSITION_COLORS = {
+    'Goalkeeper': (205, 133, 63),
+    'Defender': (144, 238, 144),
+    'Midfielder': (255, 255, 224),
+    'Attacker': (240, 128, 128)
+}
+RESULT_COLORS = {
+    'W': (144, 238, 144),
+    'D': (255, 255, 224),
+    'L': (240, 128, 128)
+}
+
+# red -> yellow -> green, like the "RdYlGn_custom" colormap of the standings table
+STANDINGS_GRADIENT = ((255, 0, 0), (255, 255, 0), (0, 128, 0))
+
+CELL_PADDING_X = 10
+CELL_PADDING_Y = 6
+MARGIN = 8
+
+
+@lru_cache(maxsize=8)
+def get_font(size):
+    try:
+        return ImageFont.truetype(PIL_FONT_PATH, size)
+    except OSError as e:
+        warn_missing_font(str(e))
+    try:
+        # Scalable since Pillow 10.1
+        return ImageFont.load_default(size)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=1)
+def warn_missing_font(error):
+    # Once per render worker rather than once per font size
+    logging.warning("Failed to load %s, tables use Pillow's default font: %s", PIL_FONT_PATH, error)
+
+
+@lru_cache(maxsize=8)
+def get_row_height(size):
+    # Measured once per font size on glyphs with both ascenders and descenders
+    left, top, right, bottom = get_font(size).getbbox("Ay|g")
+    return bottom - top + 2 * CELL_PADDING_Y
+
+
+@timed('encode')
+def encode_image(image, image_format=IMAGE_FORMAT, quality=IMAGE_QUALITY):
+    buffer = io.BytesIO()
+    if image_format in ('jpeg', 'webp'):
+        image.save(buffer, format=image_format.upper(), quality=quality)
+    else:
+        image.save(buffer, format=image_format.upper())
+    return buffer.getvalue()
+
+
+def draw_table(columns, rows, cell_color, font_size=16, image_format=IMAGE_FORMAT, quality=IMAGE_QUALITY):
+    font = get_font(font_size)
+    cells = [[str(value) if value is not None else '' for value in row] for row in rows]
+
+    # Column widths come from the widest text in each column, so the layout is known before drawing
+    widths = [int(font.getlength(column)) for column in columns]
+    for row in cells:
+        for j, text in enumerate(row):
+            widths[j] = max(widths[j], int(font.getlength(text)))
+    widths = [width + 2 * CELL_PADDING_X for width in widths]
+    row_height = get_row_height(font_size)
+
+    image = Image.new('RGB', (sum(widths) + 2 * MARGIN, row_height * (len(cells) + 1) + 2 * MARGIN), WHITE)
+    draw = ImageDraw.Draw(image)
+
+    for i, row in enumerate([list(columns)] + cells):
+        top = MARGIN + i * row_height
+        left = MARGIN
+        for j, text in enumerate(row):
+            draw.rectangle((left, top, left + widths[j], top + row_height), fill=cell_color(i, j), outline=GRID)
+            draw.text((left + widths[j] / 2, top + row_height / 2), text, fill=TEXT, font=font, anchor='mm')
+            left += widths[j]
+
+    return encode_image(image, image_format, quality)
+
+
+def _gradient(value):
+    # value in [0, 1] mapped linearly through the gradient stops
+    scaled = value * (len(STANDINGS_GRADIENT) - 1)
+    index = min(int(scaled), len(STANDINGS_GRADIENT) - 2)
+    fraction = scaled - index
+    start, end = STANDINGS_GRADIENT[index], STANDINGS_GRADIENT[index + 1]
+    return tuple(round(a + (b - a) * fraction) for a, b in zip(start, end))
+
+
+def make_standings_table_image(standings, image_size=(10, 6), image_format=IMAGE_FORMAT, quality=IMAGE_QUALITY):
+    points = [float(row.points) for row in standings]
+    low, high = min(points), max(points)
+    colors = [_gradient((value - low) / (high - low) if high > low else 0.0) for value in points]
+
+    return draw_table(Standing.COLUMNS, standings, lambda i, j: colors[i - 1] if i else WHITE,
+                      image_format=image_format, quality=quality)
+
+
+def create_players_table(players, image_format=IMAGE_FORMAT, quality=IMAGE_QUALITY):
+    position_column = Player.COLUMNS.index('position')
+
+    def cell_color(i, j):
+        if i == 0:
+            return LIGHT_GREY
+        if j == position_column:
+            return POSITION_COLORS.get(players[i - 1].position, WHITE)
+        return WHITE
+
+    return draw_table(Player.COLUMNS, players, cell_color, image_format=image_format, quality=quality)
+
+
+def create_result_table(results, image_format=IMAGE_FORMAT, quality=IMAGE_QUALITY):
+    return draw_table(FormResult.COLUMNS, results,
+                      lambda i, j: RESULT_COLORS.get(results[i - 1].outcome, WHITE) if i else LIGHT_GREY,
+                      image_format=image_format, quality=quality)
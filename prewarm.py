@@ -0,0 +1,172 @@
+import asyncio
+import heapq
+import logging
+import time
+from datetime import date
+
+from api_client import count_requests
+from config import PREWARM_LEAGUES, PREWARM_TEAMS, PREWARM_INTERVAL, PREWARM_TEAM_INTERVAL, PREWARM_FINISHED_DELAY, \
+    PREWARM_HALF_LIFE, PREWARM_QUOTA_SHARE
+from football_api_getters import LEAGUES_DICT, get_league_table, get_team_form, update_team_dict, get_team_dict
+from metrics import inc
+from rate_limiter import QUOTA, BACKGROUND
+from render_pool import render, RenderQueueFull
+
+# How often the pre-warmer looks for work, finished matches are picked up within this delay
+PREWARM_TICK = 60
+
+
+class Popularity:
+    """Request counts that decay with the given half-life, so the ranking follows current traffic."""
+
+    def __init__(self, half_life):
+        self.half_life = half_life
+        self.scores = {}
+        self.decayed_at = time.monotonic()
+
+    def _decay(self):
+        # Applied at most once a minute, the exact moment doesn't matter for a ranking
+        now = time.monotonic()
+        if now - self.decayed_at < 60:
+            return
+        factor = 0.5 ** ((now - self.decayed_at) / self.half_life)
+        self.scores = {key: score * factor for key, score in self.scores.items() if score * factor >= 0.05}
+        self.decayed_at = now
+
+    def hit(self, key):
+        self._decay()
+        self.scores[key] = self.scores.get(key, 0) + 1
+
+    def top(self, count):
+        self._decay()
+        return [key for key, _ in heapq.nlargest(count, self.scores.items(), key=lambda item: item[1])]
+
+    def __contains__(self, key):
+        return key in self.scores
+
+
+LEAGUE_POPULARITY = Popularity(PREWARM_HALF_LIFE)
+TEAM_POPULARITY = Popularity(PREWARM_HALF_LIFE)
+
+# ('league', league name) or ('team', (league name, team name)) -> when to refresh it
+_due = {}
+_spent = 0
+_spent_on = date.today()
+
+
+def record_league(league_name):
+    # Only names that resolve, anything else would fail on every pass
+    if league_name in LEAGUES_DICT:
+        LEAGUE_POPULARITY.hit(league_name)
+
+
+def record_team(league_name, team_name):
+    if team_name in get_team_dict(league_name):
+        TEAM_POPULARITY.hit((league_name, team_name))
+
+
+def get_popular_league_ids():
+    return [LEAGUES_DICT[name] for name in LEAGUE_POPULARITY.top(PREWARM_LEAGUES) if name in LEAGUES_DICT]
+
+
+def on_fixture_finished(fixture):
+    # A finished match changes its league's table and both teams' form, once the upstream has caught up
+    due = time.monotonic() + PREWARM_FINISHED_DELAY
+    league_names = [name for name, league_id in LEAGUES_DICT.items() if league_id == fixture['league']['id']]
+    for league_name in league_names:
+        if league_name in LEAGUE_POPULARITY:
+            _due.setdefault(('league', league_name), due)
+        for side in ('home', 'away'):
+            key = (league_name, fixture['teams'][side]['name'])
+            if key in TEAM_POPULARITY:
+                _due.setdefault(('team', key), due)
+
+
+def has_budget():
+    global _spent, _spent_on
+
+    if _spent_on != date.today():
+        _spent, _spent_on = 0, date.today()
+    # Until the first response tells us the quota, the background reserve of the quota manager is the only limit
+    return not QUOTA.daily_limit or _spent < QUOTA.daily_limit * PREWARM_QUOTA_SHARE
+
+
+async def warm_league(league_name):
+    if league_name not in LEAGUES_DICT:
+        return False
+    standings = await get_league_table(league_name, priority=BACKGROUND, refresh=True)
+    if standings:
+        await render('make_standings_table_image', standings)
+    return standings is not None
+
+
+async def warm_team(league_name, team_name):
+    if league_name not in LEAGUES_DICT:
+        return False
+    await update_team_dict(league_name, priority=BACKGROUND)
+    if team_name not in get_team_dict(league_name):
+        return False
+    results = await get_team_form(league_name, team_name, priority=BACKGROUND, refresh=True)
+    if results:
+        await render('create_result_table', results)
+    return results is not None
+
+
+async def warm(kind, target):
+    global _spent
+
+    # A team may also need its league's team list, only the requests actually sent count against the budget
+    with count_requests() as requests:
+        try:
+            warmed = await (warm_league(target) if kind == 'league' else warm_team(*target))
+        except RenderQueueFull:
+            # Users are keeping the render workers busy, they come first
+            warmed = False
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # One bad target (e.g. a league gone from the catalog) mustn't stop the rest of the pass
+            logging.warning("Pre-warming %s %s failed: %s", kind, target, e)
+            warmed = False
+        finally:
+            _spent += requests[0]
+    inc('prewarm_total', kind=kind, result='warmed' if warmed else 'failed')
+    return warmed
+
+
+async def prewarm_once(leagues=False, teams=False):
+    now = time.monotonic()
+    targets = [key for key, due in _due.items() if due <= now]
+    for key in targets:
+        del _due[key]
+    if leagues:
+        targets.extend(('league', name) for name in LEAGUE_POPULARITY.top(PREWARM_LEAGUES))
+    if teams:
+        targets.extend(('team', key) for key in TEAM_POPULARITY.top(PREWARM_TEAMS))
+
+    # One at a time, the pre-warmer should never compete with users for connections or render workers
+    for kind, target in dict.fromkeys(targets):
+        if not has_budget():
+            inc('prewarm_total', kind=kind, result='over_budget')
+            continue
+        await warm(kind, target)
+
+
+async def run_prewarmer():
+    # Team forms live on fixtures, which expire much sooner than standings, so they have their own schedule
+    next_leagues = time.monotonic() + PREWARM_INTERVAL
+    next_teams = time.monotonic() + PREWARM_TEAM_INTERVAL
+    while True:
+        await asyncio.sleep(PREWARM_TICK)
+        now = time.monotonic()
+        leagues, teams = now >= next_leagues, now >= next_teams
+        if leagues:
+            next_leagues = now + PREWARM_INTERVAL
+        if teams:
+            next_teams = now + PREWARM_TEAM_INTERVAL
+        try:
+            await prewarm_once(leagues, teams)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.exception("Pre-warming failed: %s", e)
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from config import API_RATE_LIMIT_PER_MINUTE, API_BURST, API_INTERACTIVE_RESERVE_TOKENS, API_BACKGROUND_QUOTA_RESERVE, \
+    API_LOW_QUOTA_THRESHOLD, API_QUOTA_PROBE_INTERVAL
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+
+class QuotaExhausted(Exception):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60
+        self.capacity = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, keep=0):
+        # Seconds until a token is available while still leaving `keep` tokens in the bucket
+        self.refill()
+        missing = keep + 1 - self.tokens
+        return 0 if missing <= 0 else missing / self.rate
+
+
+class QuotaManager:
+    """Paces upstream calls with a token bucket and tracks the daily quota reported by RapidAPI."""
+
+    def __init__(self):
+        self.bucket = TokenBucket(API_RATE_LIMIT_PER_MINUTE, API_BURST)
+        self.daily_limit = None
+        self.daily_remaining = None
+        self.daily_reset_at = None
+        self.minute_remaining = None
+        self.probed_at = 0.0
+        self.throttled = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.rejected = {INTERACTIVE: 0, BACKGROUND: 0}
+
+    def _roll_over(self):
+        # Nothing may be sent while the quota is used up, so the response that would report the reset never comes
+        if self.daily_reset_at is not None and time.time() >= self.daily_reset_at:
+            self.daily_remaining = None
+            self.daily_reset_at = None
+
+    def is_exhausted(self):
+        self._roll_over()
+        if self.daily_remaining is None or self.daily_remaining > 0:
+            return False
+        # The plan may have been upgraded or reset early, an occasional request finds out
+        if time.time() - self.probed_at >= API_QUOTA_PROBE_INTERVAL:
+            self.probed_at = time.time()
+            return False
+        return True
+
+    def remaining_share(self):
+        self._roll_over()
+        if not self.daily_limit or self.daily_remaining is None:
+            return 1.0
+        return self.daily_remaining / self.daily_limit
+
+    def is_low(self, priority=INTERACTIVE):
+        # Background work stops well before interactive requests do
+        if priority == BACKGROUND:
+            return self.remaining_share() <= API_BACKGROUND_QUOTA_RESERVE
+        return self.remaining_share() <= API_LOW_QUOTA_THRESHOLD
+
+    async def acquire(self, priority=INTERACTIVE):
+        if priority == BACKGROUND and self.is_low(BACKGROUND):
+            self.rejected[priority] += 1
+            raise QuotaExhausted("Football API quota is reserved for interactive requests")
+        if self.is_exhausted():
+            self.rejected[priority] += 1
+            raise QuotaExhausted("Daily football API quota is used up")
+
+        # Background requests leave a few tokens for interactive ones, so users never queue behind them
+        keep = min(API_INTERACTIVE_RESERVE_TOKENS, self.bucket.capacity - 1) if priority == BACKGROUND else 0
+        while True:
+            delay = self.bucket.wait_time(keep)
+            if delay <= 0:
+                break
+            self.throttled[priority] += 1
+            await asyncio.sleep(delay)
+        self.bucket.tokens -= 1
+
+    def update(self, headers, status=200):
+        # RapidAPI reports the plan's daily quota, API-Football the per-minute one
+        daily_limit = headers.get('x-ratelimit-requests-limit')
+        daily_remaining = headers.get('x-ratelimit-requests-remaining')
+        daily_reset = headers.get('x-ratelimit-requests-reset')
+        minute_remaining = headers.get('x-ratelimit-remaining')
+
+        if daily_limit is not None:
+            self.daily_limit = int(daily_limit)
+        if daily_remaining is not None:
+            self.daily_remaining = int(daily_remaining)
+            if self.daily_remaining <= 0:
+                self.probed_at = time.time()
+            # Seconds until the daily quota resets, or else the next UTC midnight
+            if daily_reset is not None:
+                self.daily_reset_at = time.time() + int(daily_reset)
+            else:
+                tomorrow = datetime.now(timezone.utc).date() + timedelta(days=1)
+                self.daily_reset_at = datetime(tomorrow.year, tomorrow.month, tomorrow.day,
+                                               tzinfo=timezone.utc).timestamp()
+        if minute_remaining is not None:
+            self.minute_remaining = int(minute_remaining)
+
+        # The server knows better than our bucket how many calls are left this minute
+        if status == 429 or (self.minute_remaining is not None and self.minute_remaining <= 0):
+            self.bucket.tokens = min(self.bucket.tokens, 0)
+
+        if self.is_low():
+            logging.warning("Football API quota is running low: %s of %s requests left",
+                            self.daily_remaining, self.daily_limit)
+
+    def stats(self):
+        return {
+            "daily_limit": self.daily_limit,
+            "daily_remaining": self.daily_remaining,
+            "daily_reset_in": max(self.daily_reset_at - time.time(), 0) if self.daily_reset_at is not None else None,
+            "minute_remaining": self.minute_remaining,
+            "throttled": dict(self.throttled),
+            "rejected": dict(self.rejected)
+        }
+
+
+QUOTA = QuotaManager()
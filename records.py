@@ -0,0 +1,51 @@
+from typing import NamedTuple, Tuple
+
+
+# Rows are plain tuples, so renderers can pass a list of them straight to a table as cell text.
+# COLUMNS keeps the header labels the DataFrames used to have.
+
+class Standing(NamedTuple):
+    position: int
+    team: str
+    matches: int
+    won: int
+    draw: int
+    lost: int
+    points: int
+
+    COLUMNS = ("Position", "Team", "Matches", "Won", "Draw", "Lost", "Points")
+
+
+class FormResult(NamedTuple):
+    result: str
+    opponent_team: str
+    outcome: str
+
+    COLUMNS = ("result", "opponent_team", "W/D/L")
+
+
+class Player(NamedTuple):
+    number: object
+    position: str
+    name: str
+    age: object
+
+    COLUMNS = ("number", "position", "name", "age")
+
+
+class LiveMatch(NamedTuple):
+    id: int
+    teams: str
+    current_result: str
+    half: str
+    time: object
+
+    COLUMNS = ("id", "teams", "current_result", "half", "time (in minutes)")
+
+
+class Prediction(NamedTuple):
+    home_team: str
+    away_team: str
+    fields: Tuple[str, ...]
+    home: Tuple[float, ...]
+    away: Tuple[float, ...]
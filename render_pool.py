@@ -0,0 +1,113 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from image_cache import fingerprint, get_image, set_image
+from metrics import span, inc, forward_observations, drain_observations, record_observations
+from singleflight import SingleFlight
+from config import RENDER_WORKERS, RENDER_QUEUE_SIZE, RENDER_QUEUE_TIMEOUT, IMAGE_FORMAT, IMAGE_QUALITY, RENDER_ENGINE
+
+_executor = None
+_slots = None
+_in_flight = SingleFlight()
+
+
+class RenderQueueFull(Exception):
+    pass
+
+
+def _init_worker():
+    # Headless backend, and pay for the heavy imports once per worker instead of once per image
+    import matplotlib
+    matplotlib.use('Agg')
+    import image_makers  # noqa: F401
+    forward_observations()
+
+
+def _run(engine, renderer_name, args, kwargs):
+    import image_makers
+    renderers = image_makers
+    if engine == 'pillow':
+        import pil_renderers
+        renderers = pil_renderers
+
+    # Renderers the engine doesn't implement (the wind rose) fall back to matplotlib
+    renderer = getattr(renderers, renderer_name, getattr(image_makers, renderer_name))
+    with span('render_cpu', renderer=renderer_name):
+        image = renderer(*args, **kwargs)
+    return image, drain_observations()
+
+
+def get_executor():
+    global _executor, _slots
+
+    if _executor is None:
+        # Forking a process that already runs threads (executor, profiler) can hand a held lock to the child,
+        # workers start from a clean interpreter instead and _init_worker does the imports
+        start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        _executor = ProcessPoolExecutor(max_workers=RENDER_WORKERS, initializer=_init_worker,
+                                        mp_context=multiprocessing.get_context(start_method))
+        _slots = asyncio.Semaphore(RENDER_QUEUE_SIZE)
+    return _executor
+
+
+async def render(renderer_name, *args, engine=None, **kwargs):
+    engine = engine or RENDER_ENGINE
+
+    # Identical data rendered with identical parameters always gives the same image
+    options = {'image_format': IMAGE_FORMAT, 'quality': IMAGE_QUALITY, **kwargs}
+    key = fingerprint(engine, renderer_name, args, options)
+
+    image = get_image(key)
+    if image is not None:
+        inc('bot_renders_total', renderer=renderer_name, result='cached')
+        return image
+
+    return await _in_flight.do(key, _render, key, engine, renderer_name, args, kwargs)
+
+
+async def _render(key, engine, renderer_name, args, kwargs):
+    executor = get_executor()
+
+    # Bounded queue: wait for a free slot, give up if rendering is backed up for too long
+    try:
+        with span('render_queue'):
+            await asyncio.wait_for(_slots.acquire(), timeout=RENDER_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        inc('bot_renders_total', renderer=renderer_name, result='queue_full')
+        raise RenderQueueFull(f"Render queue is full ({RENDER_QUEUE_SIZE} jobs)")
+
+    try:
+        loop = asyncio.get_running_loop()
+        with span('render', renderer=renderer_name):
+            image, observations = await loop.run_in_executor(executor, _run, engine, renderer_name, args, kwargs)
+    finally:
+        _slots.release()
+
+    record_observations(observations)
+    inc('bot_renders_total', renderer=renderer_name, result='rendered')
+    set_image(key, image)
+    return image
+
+
+def get_render_stats():
+    return {"workers": RENDER_WORKERS, "queue_size": RENDER_QUEUE_SIZE, "in_flight": len(_in_flight)}
+
+
+def _ping():
+    return True
+
+
+async def warm_up():
+    # Start every worker now so the first real render doesn't pay for process start and matplotlib import
+    executor = get_executor()
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(executor, _ping) for _ in range(RENDER_WORKERS)))
+
+
+def shutdown():
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+    _executor = None
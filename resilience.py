@@ -0,0 +1,81 @@
+import logging
+import time
+
+from config import BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Fails fast after repeated upstream errors, then lets a single probe through once the timeout passes."""
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+
+    def ready(self):
+        # Same answer as allow(), without claiming the half-open probe
+        if self.state == OPEN:
+            return time.monotonic() - self.opened_at >= self.reset_timeout
+        return self.state == CLOSED
+
+    def allow(self):
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+            return True
+        # While half-open only the probe already sent is allowed
+        return self.state == CLOSED
+
+    def check(self):
+        """Raises CircuitOpen unless a call may go out; returns True if that call is the half-open probe."""
+        probing = self.state != CLOSED
+        if not self.allow():
+            raise CircuitOpen(f"{self.name} circuit is open")
+        return probing
+
+    def release_probe(self):
+        # The probe ended without an answer (cancelled, or failed before reaching the upstream),
+        # so the next call gets to probe instead of the circuit staying half-open for good
+        if self.state == HALF_OPEN:
+            self.state = OPEN
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logging.info("%s circuit closed", self.name)
+        self.state = CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        """Returns True if this failure opened the circuit."""
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            opened = self.state != OPEN
+            if opened:
+                self.trips += 1
+                logging.warning("%s circuit opened after %d failures", self.name, self.failures)
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            return opened
+        return False
+
+    def trip(self, opened_ago=0.0):
+        # Opened elsewhere (another bot worker) `opened_ago` seconds ago, the reset timeout runs from then
+        if self.state == CLOSED:
+            self.trips += 1
+            logging.warning("%s circuit opened by another worker", self.name)
+            self.state = OPEN
+            self.opened_at = time.monotonic() - opened_ago
+
+    def stats(self):
+        return {"state": self.state, "failures": self.failures, "trips": self.trips}
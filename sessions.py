@@ -0,0 +1,52 @@
+import time
+from collections import OrderedDict
+
+from config import SESSION_MAX_CHATS, SESSION_IDLE_TIMEOUT
+
+
+class ChatSession:
+    __slots__ = ('league', 'team', 'last_seen')
+
+    def __init__(self):
+        self.league = ''
+        self.team = ''
+        self.last_seen = time.monotonic()
+
+
+class SessionStore:
+    """Per-chat selection state, bounded in size and dropped after a period of inactivity."""
+
+    def __init__(self, max_chats=SESSION_MAX_CHATS, idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.max_chats = max_chats
+        self.idle_timeout = idle_timeout
+        self._sessions = OrderedDict()
+
+    def get(self, chat_id):
+        now = time.monotonic()
+        self._expire(now)
+
+        session = self._sessions.get(chat_id)
+        if session is None:
+            session = self._sessions[chat_id] = ChatSession()
+            # Forget the least recently active chat once the store is full
+            if len(self._sessions) > self.max_chats:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(chat_id)
+
+        session.last_seen = now
+        return session
+
+    def _expire(self, now):
+        # Sessions are kept in activity order, so the idle ones are always at the front
+        while self._sessions:
+            chat_id, session = next(iter(self._sessions.items()))
+            if now - session.last_seen < self.idle_timeout:
+                break
+            del self._sessions[chat_id]
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+SESSIONS = SessionStore()
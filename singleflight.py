@@ -0,0 +1,27 @@
+import asyncio
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution whose result every caller shares."""
+
+    def __init__(self):
+        self._in_flight = {}
+        self.shared = 0
+
+    async def do(self, key, func, *args, **kwargs):
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.shared += 1
+            # Shield so one cancelled waiter doesn't cancel the call for everyone else
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(func(*args, **kwargs))
+        self._in_flight[key] = future
+        future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(future)
+
+    def __contains__(self, key):
+        return key in self._in_flight
+
+    def __len__(self):
+        return len(self._in_flight)
@@ -0,0 +1,313 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import STORE_PATH
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leagues (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    country TEXT,
+    seasons TEXT NOT NULL,
+    current_season INTEGER,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS leagues_name ON leagues (name);
+
+CREATE TABLE IF NOT EXISTS teams (
+    league_id INTEGER NOT NULL,
+    season INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (league_id, season, id)
+);
+CREATE INDEX IF NOT EXISTS teams_name ON teams (name);
+
+CREATE TABLE IF NOT EXISTS squads (
+    team_id INTEGER PRIMARY KEY,
+    payload TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS standings (
+    league_id INTEGER NOT NULL,
+    season INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (league_id, season)
+);
+
+CREATE TABLE IF NOT EXISTS fixtures (
+    id INTEGER PRIMARY KEY,
+    league_id INTEGER,
+    home_team_id INTEGER,
+    away_team_id INTEGER,
+    kickoff INTEGER,
+    status TEXT,
+    payload TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fixtures_league ON fixtures (league_id, kickoff);
+CREATE INDEX IF NOT EXISTS fixtures_home_team ON fixtures (home_team_id, kickoff);
+CREATE INDEX IF NOT EXISTS fixtures_away_team ON fixtures (away_team_id, kickoff);
+
+CREATE TABLE IF NOT EXISTS shared_cache (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (namespace, key)
+);
+
+CREATE TABLE IF NOT EXISTS predictions (
+    fixture_id INTEGER PRIMARY KEY,
+    payload TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS subscriptions (
+    chat_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    target_id INTEGER NOT NULL,
+    PRIMARY KEY (chat_id, kind, target_id)
+);
+"""
+
+# Reads and writes use separate connections, so a write waiting on another worker's lock never holds up a read
+_connection = None
+_write_connection = None
+_lock = threading.Lock()
+_write_lock = threading.Lock()
+_pending_writes = set()
+# Writes wait on one lock anyway, a single thread also keeps them in the order they were made
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='store-writer')
+
+
+def _connect():
+    directory = os.path.dirname(STORE_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Several bot workers may share the file, so wait on their locks instead of failing right away
+    connection = sqlite3.connect(STORE_PATH, check_same_thread=False, isolation_level=None, timeout=10)
+    # WAL lets readers keep going while a refresh is being written
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
+
+
+def get_connection():
+    global _connection
+
+    if _connection is None:
+        _connection = _connect()
+        _connection.executescript(SCHEMA)
+        _migrate(_connection)
+    return _connection
+
+
+def get_write_connection():
+    global _write_connection
+
+    if _write_connection is None:
+        # The schema is created by the read connection
+        with _lock:
+            get_connection()
+        _write_connection = _connect()
+    return _write_connection
+
+
+def _migrate(connection):
+    # Stores created before leagues knew their current season
+    columns = {row[1] for row in connection.execute('PRAGMA table_info(leagues)')}
+    if 'current_season' not in columns:
+        connection.execute('ALTER TABLE leagues ADD COLUMN current_season INTEGER')
+
+
+def _execute(query, params=()):
+    with _lock:
+        return get_connection().execute(query, params).fetchall()
+
+
+def _write(query, rows):
+    _write_all((query, rows))
+
+
+def _write_all(*statements):
+    # One transaction, readers see either none or all of the statements
+    with _write_lock:
+        connection = get_write_connection()
+        connection.execute('BEGIN')
+        try:
+            for query, rows in statements:
+                connection.executemany(query, rows)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+
+def save_in_background(save, *args):
+    """Runs a store write in a thread without waiting for it.
+
+    A write can wait on another bot worker's lock for the whole busy timeout, the event loop must not wait with it.
+    """
+    future = asyncio.get_running_loop().run_in_executor(_writer, save, *args)
+    _pending_writes.add(future)
+    future.add_done_callback(_write_done)
+
+
+def _write_done(future):
+    _pending_writes.discard(future)
+    if not future.cancelled() and future.exception() is not None:
+        logging.warning("Store write failed: %s", future.exception())
+
+
+async def wait_for_writes():
+    if _pending_writes:
+        await asyncio.wait(list(_pending_writes))
+
+
+def _is_fresh(updated_at, max_age):
+    return max_age is None or time.time() - updated_at < max_age
+
+
+def save_leagues(leagues):
+    # The list replaces the stored one, a league left out of it must not linger as a row that is never refreshed
+    now = time.time()
+    _write_all(('DELETE FROM leagues', [()]),
+               ('INSERT OR REPLACE INTO leagues (id, name, country, seasons, current_season, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(league['id'], league['name'], league['country'], json.dumps(league['seasons']),
+                  league.get('current_season'), now)
+                 for league in leagues]))
+
+
+def load_leagues(max_age=None):
+    rows = _execute('SELECT id, name, country, seasons, current_season, updated_at FROM leagues ORDER BY id')
+    if not rows or not all(_is_fresh(row[5], max_age) for row in rows):
+        return None
+    return [{"id": row[0], "name": row[1], "country": row[2], "seasons": json.loads(row[3]), "current_season": row[4]}
+            for row in rows]
+
+
+def save_teams(league_id, season, teams_dict):
+    now = time.time()
+    _write_all(('DELETE FROM teams WHERE league_id = ? AND season = ?', [(league_id, season)]),
+               ('INSERT OR REPLACE INTO teams (league_id, season, id, name, updated_at) VALUES (?, ?, ?, ?, ?)',
+                [(league_id, season, team_id, team_name, now) for team_name, team_id in teams_dict.items()]))
+
+
+def load_teams(league_id, season, max_age=None):
+    rows = _execute('SELECT name, id, updated_at FROM teams WHERE league_id = ? AND season = ?', (league_id, season))
+    if not rows or not all(_is_fresh(row[2], max_age) for row in rows):
+        return None
+    return {row[0]: row[1] for row in rows}
+
+
+def save_squad(team_id, payload):
+    _write('INSERT OR REPLACE INTO squads (team_id, payload, updated_at) VALUES (?, ?, ?)',
+           [(team_id, json.dumps(payload), time.time())])
+
+
+def load_squad(team_id, max_age=None):
+    rows = _execute('SELECT payload, updated_at FROM squads WHERE team_id = ?', (team_id,))
+    if not rows or not _is_fresh(rows[0][1], max_age):
+        return None
+    return json.loads(rows[0][0])
+
+
+def save_standings(league_id, season, payload):
+    _write('INSERT OR REPLACE INTO standings (league_id, season, payload, updated_at) VALUES (?, ?, ?, ?)',
+           [(league_id, season, json.dumps(payload), time.time())])
+
+
+def load_standings(league_id, season, max_age=None):
+    rows = _execute('SELECT payload, updated_at FROM standings WHERE league_id = ? AND season = ?',
+                    (league_id, season))
+    if not rows or not _is_fresh(rows[0][1], max_age):
+        return None
+    return json.loads(rows[0][0])
+
+
+def save_fixtures(fixtures):
+    now = time.time()
+    _write('INSERT OR REPLACE INTO fixtures '
+           '(id, league_id, home_team_id, away_team_id, kickoff, status, payload, updated_at) '
+           'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+           [(fixture['fixture']['id'], fixture.get('league', {}).get('id'), fixture['teams']['home']['id'],
+             fixture['teams']['away']['id'], fixture['fixture'].get('timestamp'),
+             fixture['fixture']['status']['short'], json.dumps(fixture), now)
+            for fixture in fixtures])
+
+
+def load_fixture(fixture_id, max_age=None):
+    rows = _execute('SELECT payload, updated_at FROM fixtures WHERE id = ?', (fixture_id,))
+    if not rows or not _is_fresh(rows[0][1], max_age):
+        return None
+    return json.loads(rows[0][0])
+
+
+def save_prediction(fixture_id, payload, expires_at):
+    _write('INSERT OR REPLACE INTO predictions (fixture_id, payload, expires_at) VALUES (?, ?, ?)',
+           [(fixture_id, json.dumps(payload), expires_at)])
+
+
+def load_prediction(fixture_id):
+    rows = _execute('SELECT payload, expires_at FROM predictions WHERE fixture_id = ?', (fixture_id,))
+    if not rows or rows[0][1] <= time.time():
+        return None
+    return json.loads(rows[0][0])
+
+
+def save_subscription(chat_id, kind, target_id):
+    _write('INSERT OR IGNORE INTO subscriptions (chat_id, kind, target_id) VALUES (?, ?, ?)',
+           [(chat_id, kind, target_id)])
+
+
+def delete_subscriptions(chat_id):
+    _write('DELETE FROM subscriptions WHERE chat_id = ?', [(chat_id,)])
+
+
+def delete_target_subscriptions(kind, target_id):
+    _write('DELETE FROM subscriptions WHERE kind = ? AND target_id = ?', [(kind, target_id)])
+
+
+def load_subscriptions():
+    return _execute('SELECT chat_id, kind, target_id FROM subscriptions')
+
+
+def shared_cache_get(namespace, key):
+    rows = _execute('SELECT value, expires_at FROM shared_cache WHERE namespace = ? AND key = ?', (namespace, key))
+    if not rows or (rows[0][1] is not None and rows[0][1] <= time.time()):
+        return None
+    return json.loads(rows[0][0])
+
+
+def shared_cache_set(namespace, key, value, ttl=None):
+    expires_at = time.time() + ttl if ttl is not None else None
+    _write('INSERT OR REPLACE INTO shared_cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)',
+           [(namespace, key, json.dumps(value), expires_at)])
+
+
+def shared_cache_prune():
+    _write('DELETE FROM shared_cache WHERE expires_at IS NOT NULL AND expires_at <= ?', [(time.time(),)])
+
+
+def close():
+    global _connection, _write_connection
+
+    with _write_lock:
+        if _write_connection is not None:
+            _write_connection.close()
+        _write_connection = None
+    with _lock:
+        if _connection is not None:
+            _connection.close()
+        _connection = None
@@ -1,20 +1,23 @@
-def create_current_matches_string(df):
+def create_current_matches_string(matches):
 
-    # Initialize an empty string to store the matches
-    matches_string = ""
+    # Build every match line first and join them once at the end
+    match_strings = [f"{match.id} - {match.teams} {match.current_result} ({match.half} - {match.time}m)"
+                     for match in matches]
 
-    # Iterate over rows in the DataFrame
-    for index, row in df.iterrows():
-        # Extract data from the row
-        match_id = row['id']
-        teams = row['teams']
-        current_result = row['current_result']
-        half = row['half']
-        time = row['time (in minutes)']
+    return "".join(match_string + "\n" for match_string in match_strings)
 
-        # Construct the match string and append it to the matches string
-        match_string = f"{match_id} - {teams} {current_result} ({half} - {time}m)"
-        matches_string += match_string + "\n"
 
-    return matches_string
+def create_match_update_string(fixture, change):
+    teams = f"{fixture['teams']['home']['name']} vs {fixture['teams']['away']['name']}"
+    home_goals = fixture['goals']['home'] if fixture['goals']['home'] is not None else 0
+    away_goals = fixture['goals']['away'] if fixture['goals']['away'] is not None else 0
+    status = fixture['fixture']['status']
+    elapsed = f" - {status['elapsed']}m" if status.get('elapsed') is not None else ""
 
+    if change == 'goal':
+        return f"Goal! {fixture['fixture']['id']} - {teams} {home_goals}:{away_goals} ({status['short']}{elapsed})"
+    if change == 'finished':
+        # Abandoned or postponed matches end their updates too, with their own status
+        label = "Full time" if status['short'] in ('FT', 'AET', 'PEN') else status['long']
+        return f"{label}: {fixture['fixture']['id']} - {teams} {home_goals}:{away_goals}"
+    return f"{fixture['fixture']['id']} - {teams} {home_goals}:{away_goals} ({status['long']}{elapsed})"
@@ -0,0 +1,91 @@
+import hashlib
+import io
+
+from aiogram import types
+from aiogram.utils.exceptions import BadRequest
+
+from cache import TTLCache
+from config import FILE_ID_CACHE_MAX_ENTRIES, SHARED_CACHE
+from metrics import span, inc
+from storage import shared_cache_get, shared_cache_set, save_in_background
+
+FILE_ID_CACHE = TTLCache(max_entries=FILE_ID_CACHE_MAX_ENTRIES)
+
+
+def content_fingerprint(image):
+    return hashlib.sha256(image).hexdigest()
+
+
+def get_file_id(key):
+    file_id = FILE_ID_CACHE.get(key)
+    if file_id is None and SHARED_CACHE:
+        file_id = shared_cache_get('file_id', key)
+    return file_id
+
+
+def remember_file_id(key, sent):
+    if sent.photo:
+        FILE_ID_CACHE.set(key, sent.photo[-1].file_id)
+        if SHARED_CACHE:
+            save_in_background(shared_cache_set, 'file_id', key, sent.photo[-1].file_id)
+
+
+async def answer_photo(message: types.Message, image, filename):
+    key = content_fingerprint(image)
+
+    # Telegram already has this exact picture, resend it by reference instead of uploading it again
+    file_id = get_file_id(key)
+    if file_id is not None:
+        try:
+            with span('resend'):
+                sent = await message.answer_photo(file_id)
+            inc('telegram_photos_total', result='resent')
+            return sent
+        except BadRequest:
+            FILE_ID_CACHE.pop(key)
+
+    with span('upload'):
+        sent = await message.answer_photo(types.InputFile(io.BytesIO(image), filename=filename))
+    inc('telegram_photos_total', result='uploaded')
+    inc('telegram_uploaded_bytes_total', len(image))
+    remember_file_id(key, sent)
+    return sent
+
+
+async def answer_photo_group(message: types.Message, photos):
+    """Sends (image, filename, caption) photos as one album, reusing the file ids Telegram already knows."""
+    keys = [content_fingerprint(image) for image, _, _ in photos]
+    file_ids = [get_file_id(key) for key in keys]
+
+    def make_media_group(use_file_ids):
+        media = types.MediaGroup()
+        for (image, filename, caption), file_id in zip(photos, file_ids):
+            if use_file_ids and file_id is not None:
+                media.attach_photo(file_id, caption=caption)
+            else:
+                media.attach_photo(types.InputFile(io.BytesIO(image), filename=filename), caption=caption)
+        return media
+
+    try:
+        with span('upload_group'):
+            sent = await message.answer_media_group(make_media_group(True))
+    except BadRequest:
+        # One of the cached file ids is no longer valid, upload them all again
+        for key in keys:
+            FILE_ID_CACHE.pop(key)
+        file_ids = [None] * len(keys)
+        with span('upload_group'):
+            sent = await message.answer_media_group(make_media_group(False))
+
+    for (image, _, _), key, file_id, sent_message in zip(photos, keys, file_ids, sent):
+        if file_id is None:
+            inc('telegram_photos_total', result='uploaded')
+            inc('telegram_uploaded_bytes_total', len(image))
+            remember_file_id(key, sent_message)
+        else:
+            inc('telegram_photos_total', result='resent')
+    return sent
+
+
+def get_file_id_stats():
+    return FILE_ID_CACHE.stats()
@@ -0,0 +1,155 @@
+import argparse
+import asyncio
+import hmac
+import json
+import logging
+import time
+
+from aiohttp import web, ClientSession
+from aiogram import Bot, Dispatcher, types
+
+from config import TELE_TOKEN, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_MAX_IN_FLIGHT, \
+    WEBHOOK_SHUTDOWN_TIMEOUT
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class UpdateProcessor:
+    """Runs dispatcher updates as background tasks, at most `max_in_flight` at a time."""
+
+    def __init__(self, dp: Dispatcher, max_in_flight=WEBHOOK_MAX_IN_FLIGHT):
+        self.dp = dp
+        self.max_in_flight = max_in_flight
+        self.tasks = set()
+        self.accepting = True
+        self.processed = 0
+        self.rejected = 0
+
+    def submit(self, update: types.Update):
+        if not self.accepting or len(self.tasks) >= self.max_in_flight:
+            self.rejected += 1
+            return False
+
+        task = asyncio.create_task(self._process(update))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return True
+
+    async def _process(self, update: types.Update):
+        # Handlers reach the bot through the context, which a fresh task doesn't inherit from the dispatcher
+        Bot.set_current(self.dp.bot)
+        Dispatcher.set_current(self.dp)
+        try:
+            await self.dp.process_update(update)
+        except Exception as e:
+            logging.exception("Failed to process update %s: %s", update.update_id, e)
+        finally:
+            self.processed += 1
+
+    async def drain(self, timeout=WEBHOOK_SHUTDOWN_TIMEOUT):
+        self.accepting = False
+        if self.tasks:
+            logging.info("Waiting for %d updates in flight", len(self.tasks))
+            done, pending = await asyncio.wait(set(self.tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+
+
+async def handle_update(request: web.Request):
+    if WEBHOOK_SECRET and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''), WEBHOOK_SECRET):
+        return web.Response(status=403)
+
+    try:
+        update = types.Update.to_object(await request.json())
+    except (ValueError, TypeError):
+        return web.Response(status=400)
+
+    # Telegram retries anything that isn't 2xx, which is exactly the backpressure we want when full
+    if not request.app['processor'].submit(update):
+        return web.Response(status=503)
+    return web.Response(status=200)
+
+
+async def register_webhook(bot: Bot):
+    if WEBHOOK_URL:
+        await bot.set_webhook(WEBHOOK_URL + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET or None,
+                              max_connections=WEBHOOK_MAX_IN_FLIGHT)
+
+
+def make_app(dp: Dispatcher = None, on_startup=None, on_shutdown=None, processor=None):
+    # Without a dispatcher the app only forwards updates to the given processor (see workers.py)
+    app = web.Application()
+    app['processor'] = processor or UpdateProcessor(dp)
+    app.router.add_post(WEBHOOK_PATH, handle_update)
+
+    async def startup(app):
+        if dp is None:
+            bot = Bot(token=TELE_TOKEN)
+            await register_webhook(bot)
+            await (await bot.get_session()).close()
+            return
+
+        Bot.set_current(dp.bot)
+        Dispatcher.set_current(dp)
+        if on_startup is not None:
+            await on_startup(dp)
+        await register_webhook(dp.bot)
+
+    async def shutdown(app):
+        # Stop taking updates, let the ones in flight finish, then release everything else
+        await app['processor'].drain()
+        if dp is None:
+            return
+        if on_shutdown is not None:
+            await on_shutdown(dp)
+        await dp.storage.close()
+        await dp.storage.wait_closed()
+        session = await dp.bot.get_session()
+        await session.close()
+
+    app.on_startup.append(startup)
+    app.on_shutdown.append(shutdown)
+    return app
+
+
+def start_app(app):
+    logging.info("Serving webhook on http://%s:%s%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+    web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT, shutdown_timeout=WEBHOOK_SHUTDOWN_TIMEOUT)
+
+
+def start_webhook(dp: Dispatcher, on_startup=None, on_shutdown=None):
+    start_app(make_app(dp, on_startup, on_shutdown))
+
+
+def make_message_update(update_id, chat_id, text):
+    # Minimal payload shaped like the one Telegram posts for a private text message
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "first_name": f"User {chat_id}"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"User {chat_id}"},
+            "text": text,
+            **({"entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]}
+               if text.startswith('/') else {})
+        }
+    }
+
+
+async def post_updates(url, texts, chat_id):
+    headers = {SECRET_HEADER: WEBHOOK_SECRET} if WEBHOOK_SECRET else {}
+    async with ClientSession() as session:
+        for update_id, text in enumerate(texts, start=1):
+            async with session.post(url, json=make_message_update(update_id, chat_id, text), headers=headers) as response:
+                print(json.dumps(text), '->', response.status)
+
+
+if __name__ == '__main__':
+    # Post synthetic updates to a locally running webhook: python webhook.py /start "Premier League" Table
+    parser = argparse.ArgumentParser(description="Post synthetic Telegram updates to the bot webhook")
+    parser.add_argument('texts', nargs='+')
+    parser.add_argument('--chat', type=int, default=1)
+    parser.add_argument('--url', default=f'http://127.0.0.1:{WEBHOOK_PORT}{WEBHOOK_PATH}')
+    args = parser.parse_args()
+    asyncio.run(post_updates(args.url, args.texts, args.chat))
@@ -0,0 +1,230 @@
+"""Sharded multi-process mode: python workers.py
+
+A front process receives updates (long polling, or the webhook server with BOT_MODE=webhook) and hands each one
+to one of BOT_WORKERS worker processes chosen by chat id. Every worker runs the full handler stack from main.py
+and handles one chat's updates in arrival order. Workers share the SQLite store, API responses, Telegram file ids,
+circuit breaker trips and (on disk) rendered images. The API rate limit and the render processes are split
+between them.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+
+from config import BOT_WORKERS, BOT_MODE, WORKER_MAX_IN_FLIGHT, WORKER_QUEUE_SIZE, TELE_TOKEN, METRICS_PORT, \
+    API_RATE_LIMIT_PER_MINUTE, API_BURST, RENDER_WORKERS, SHARED_CACHE_PRUNE_INTERVAL, POLLING_MAX_RETRY_DELAY
+
+
+def get_chat_id(update_data):
+    for field in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        if field in update_data:
+            return update_data[field]['chat']['id']
+    if 'callback_query' in update_data and 'message' in update_data['callback_query']:
+        return update_data['callback_query']['message']['chat']['id']
+    for field in ('inline_query', 'chosen_inline_result', 'callback_query', 'my_chat_member', 'chat_member'):
+        if field in update_data:
+            return update_data[field]['from']['id']
+    return 0
+
+
+class ShardedProcessor:
+    """Front side: same submit() interface as webhook.UpdateProcessor, but forwards raw updates to workers."""
+
+    def __init__(self, queues):
+        self.queues = queues
+        self.accepting = True
+        self.processed = 0
+        self.rejected = 0
+
+    def submit(self, update):
+        update_data = update.to_python() if hasattr(update, 'to_python') else update
+        shard = self.queues[get_chat_id(update_data) % len(self.queues)]
+        try:
+            shard.put_nowait(update_data)
+        except queue.Full:
+            self.rejected += 1
+            return False
+        self.processed += 1
+        return True
+
+    async def drain(self, timeout=None):
+        self.accepting = False
+
+
+class ChatLocks:
+    """One lock per chat with pending updates, dropped as soon as nobody is waiting on it."""
+
+    def __init__(self):
+        self._locks = {}
+        self._waiting = {}
+
+    async def acquire(self, chat_id):
+        lock = self._locks.setdefault(chat_id, asyncio.Lock())
+        self._waiting[chat_id] = self._waiting.get(chat_id, 0) + 1
+        await lock.acquire()
+
+    def release(self, chat_id):
+        self._locks[chat_id].release()
+        self._waiting[chat_id] -= 1
+        if not self._waiting[chat_id]:
+            del self._waiting[chat_id]
+            del self._locks[chat_id]
+
+
+async def prune_shared_cache():
+    from storage import shared_cache_prune
+
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(SHARED_CACHE_PRUNE_INTERVAL)
+        try:
+            await loop.run_in_executor(None, shared_cache_prune)
+        except Exception as e:
+            logging.exception("Pruning the shared cache failed: %s", e)
+
+
+async def worker_loop(index, updates):
+    import main
+    from aiogram import Bot, Dispatcher, types
+
+    dp = main.dp
+    Bot.set_current(dp.bot)
+    Dispatcher.set_current(dp)
+    await main.on_startup(dp)
+    prune_task = asyncio.create_task(prune_shared_cache()) if index == 0 else None
+
+    loop = asyncio.get_running_loop()
+    # Updates taken off the queue are bounded by `pending`, the ones being handled at once by `slots`
+    pending = asyncio.Semaphore(WORKER_QUEUE_SIZE)
+    slots = asyncio.Semaphore(WORKER_MAX_IN_FLIGHT)
+    chat_locks = ChatLocks()
+    tasks = set()
+
+    async def process(update_data):
+        chat_id = get_chat_id(update_data)
+        # asyncio locks are fair, so a chat's updates run one at a time in the order they arrived. The slot is
+        # only taken once it's the update's turn, a chat flooding updates can't hold every slot waiting on itself
+        await chat_locks.acquire(chat_id)
+        try:
+            async with slots:
+                await dp.process_update(types.Update.to_object(update_data))
+        except Exception as e:
+            logging.exception("Failed to process update %s: %s", update_data.get('update_id'), e)
+        finally:
+            chat_locks.release(chat_id)
+            pending.release()
+
+    while True:
+        update_data = await loop.run_in_executor(None, updates.get)
+        if update_data is None:
+            break
+        await pending.acquire()
+        task = asyncio.create_task(process(update_data))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.wait(tasks)
+    if prune_task is not None:
+        prune_task.cancel()
+    await main.on_shutdown(dp)
+    session = await dp.bot.get_session()
+    await session.close()
+
+
+def run_worker(index, updates):
+    # Ctrl+C goes to the whole process group, the front decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO, format=f'[worker {index}] %(levelname)s:%(name)s:%(message)s')
+    asyncio.run(worker_loop(index, updates))
+
+
+def start_workers(count):
+    # Set before the workers start so their config picks it up
+    os.environ['SHARED_CACHE'] = '1'
+    os.environ.setdefault('IMAGE_CACHE_DIR', 'memory/images')
+    # The limits are for the whole bot, every worker paces its own calls and runs its own render pool
+    os.environ['API_RATE_LIMIT_PER_MINUTE'] = str(max(API_RATE_LIMIT_PER_MINUTE // count, 1))
+    os.environ['API_BURST'] = str(max(API_BURST // count, 1))
+    os.environ['RENDER_WORKERS'] = str(max(RENDER_WORKERS // count, 1))
+
+    context = multiprocessing.get_context('spawn')
+    queues = [context.Queue(WORKER_QUEUE_SIZE) for _ in range(count)]
+    processes = []
+    for index, updates in enumerate(queues):
+        # Live matches are polled, popular data pre-warmed and the team catalog synced by the first worker only,
+        # its share of the chats is a fair sample of what is popular
+        os.environ['LIVE_POLLER_ENABLED'] = '1' if index == 0 else '0'
+        os.environ['PREWARM_ENABLED'] = '1' if index == 0 else '0'
+        os.environ['CATALOG_SYNC_ENABLED'] = '1' if index == 0 else '0'
+        if METRICS_PORT:
+            # Every worker serves its own metrics, on consecutive ports
+            os.environ['METRICS_PORT'] = str(METRICS_PORT + index)
+        process = context.Process(target=run_worker, args=(index, updates), name=f'bot-worker-{index}')
+        process.start()
+        processes.append(process)
+    return queues, processes
+
+
+def stop_workers(queues, processes):
+    for updates in queues:
+        updates.put(None)
+    for process in processes:
+        process.join()
+
+
+async def poll_updates(processor):
+    from aiogram import Bot
+    from aiogram.utils.exceptions import TelegramAPIError, RetryAfter
+
+    bot = Bot(token=TELE_TOKEN)
+    offset = None
+    retry_delay = 1
+    try:
+        while True:
+            # Telegram timing out or failing now and then is no reason to stop the bot
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=20)
+            except RetryAfter as e:
+                logging.warning("Polling is throttled, retrying in %s s", e.timeout)
+                await asyncio.sleep(e.timeout)
+                continue
+            except (TelegramAPIError, asyncio.TimeoutError) as e:
+                logging.warning("Failed to get updates, retrying in %s s: %r", retry_delay, e)
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, POLLING_MAX_RETRY_DELAY)
+                continue
+            retry_delay = 1
+
+            for update in updates:
+                offset = update.update_id + 1
+                # A full shard is waited out rather than dropped, polling has no retry on the Telegram side
+                while not processor.submit(update):
+                    await asyncio.sleep(0.1)
+    finally:
+        session = await bot.get_session()
+        await session.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='[front] %(levelname)s:%(name)s:%(message)s')
+    queues, processes = start_workers(BOT_WORKERS)
+    processor = ShardedProcessor(queues)
+    logging.info("Started %d bot workers", len(processes))
+
+    try:
+        if BOT_MODE == 'webhook':
+            from webhook import make_app, start_app
+            start_app(make_app(processor=processor))
+        else:
+            asyncio.run(poll_updates(processor))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_workers(queues, processes)
+
+
+if __name__ == '__main__':
+    main()